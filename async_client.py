@@ -0,0 +1,178 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Awaitable, Callable, Optional, TypeVar
+from logging import Logger
+import requests
+from requests.adapters import HTTPAdapter
+import torrent_utils
+import instrumentation
+from rules import Login, ApiSettings
+from torrent_record import TorrentRecord
+
+# Constants
+API_V2_BASE = "/api/v2"
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+T = TypeVar('T')
+
+
+class AsyncQbitClient:
+    """
+    asyncio client for the qBittorrent WebAPI.
+
+    Calls run on a pooled requests.Session in a thread pool, so keep-alive connections are
+    reused and at most 'max_concurrency' requests are in flight. Every request has a timeout,
+    connection errors and 5xx answers are retried with exponential backoff, and a 403 logs in
+    again (once for any number of concurrent 403s) and retries the request.
+
+    Synchronous code drives the coroutines with run(), e.g.
+    client.run(client.torrent_files_many(hashes)).
+    """
+
+    def __init__(self, login: Login, settings: ApiSettings, logger: Logger, session: Optional[requests.Session] = None):
+        self.login_details = login
+        self.api_address = login.address
+        self.settings = settings
+        self.logger = logger
+        if session is None:
+            session = requests.Session()
+            instrumentation.instrument_session(session)
+        self.session = session
+        self.session.mount(self.api_address, HTTPAdapter(pool_connections=1, pool_maxsize=settings.max_concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=settings.max_concurrency, thread_name_prefix='qbt-api')
+        self._loop = asyncio.new_event_loop()
+        # Created on self._loop by the first run(): before Python 3.10 they bind to the loop current at creation
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._login_lock: Optional[asyncio.Lock] = None
+        self._login_generation = 0
+
+    def run(self, coroutine: Awaitable[T]) -> T:
+        """Run a coroutine of this client to completion from synchronous code."""
+        if self._semaphore is None:
+            self._loop.run_until_complete(self._create_primitives())
+        return self._loop.run_until_complete(coroutine)
+
+    async def _create_primitives(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.settings.max_concurrency)
+        self._login_lock = asyncio.Lock()
+
+    def close(self) -> None:
+        self._loop.close()
+        self._executor.shutdown(wait=False)
+
+    async def _call(self, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await self._loop.run_in_executor(self._executor, lambda: function(*args, **kwargs))
+
+    async def login(self) -> None:
+        """Log in to the WebUI, raising requests.RequestException or ValueError on failure."""
+        await self._call(torrent_utils.authenticate, self.session, self.api_address,
+                         self.login_details.username, self.login_details.password)
+        self._login_generation += 1
+
+    async def _relogin(self, generation: int) -> None:
+        async with self._login_lock:
+            if generation != self._login_generation:
+                # Another request logged in while this one waited for the lock
+                return
+            torrent_utils.clear_session_cookie(self.session)
+            await self.login()
+            self.logger.debug("WebUI session expired, logged in again")
+
+    async def request(self, method: str, endpoint: str, **kwargs: Any) -> requests.Response:
+        """Send a request to /api/v2/<endpoint> with the timeout, retry and re-login policy."""
+        url = f"{self.api_address}{API_V2_BASE}/{endpoint}"
+        retries = self.settings.retries
+        attempt = 0
+        relogged = False
+        while True:
+            generation = self._login_generation
+            try:
+                async with self._semaphore:
+                    response = await self._call(self.session.request, method, url,
+                                                timeout=self.settings.timeout_seconds, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= retries:
+                    raise
+                error = str(e)
+            else:
+                if response.status_code == 403 and not relogged:
+                    relogged = True
+                    await self._relogin(generation)
+                    continue
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    response.raise_for_status()
+                    return response
+                error = f"HTTP {response.status_code}"
+            delay = self.settings.retry_backoff_seconds * 2 ** attempt
+            attempt += 1
+            self.logger.debug(f"{method} {endpoint} failed ({error}), retry {attempt}/{retries} in {delay:g}s")
+            await asyncio.sleep(delay)
+
+    async def torrents_info(self) -> List[Dict[str, Any]]:
+        """
+        Get the list of all torrents, as compact TorrentRecords. With '[api] stream_torrent_list'
+        the body is parsed in a worker thread while it downloads instead of being buffered.
+        """
+        instrumentation.count('json_loads')
+        if not self.settings.stream_torrent_list:
+            response = await self.request('GET', 'torrents/info')
+            return response.json(object_hook=TorrentRecord.from_json)
+        response = await self.request('GET', 'torrents/info', stream=True)
+        return await self._call(lambda: list(torrent_utils.stream_torrent_records(response)))
+
+    async def torrent_files(self, torrent_hash: str) -> List[Dict[str, Any]]:
+        """Get the file list of a torrent."""
+        response = await self.request('GET', 'torrents/files', params={'hash': torrent_hash})
+        instrumentation.count('json_loads')
+        return response.json()
+
+    async def torrent_files_many(self, torrent_hashes: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get the file lists of many torrents concurrently. Like torrent_utils.get_torrent_files,
+        a torrent whose request fails is logged and gets an empty list.
+        """
+        results = await asyncio.gather(*(self.torrent_files(torrent_hash) for torrent_hash in torrent_hashes),
+                                       return_exceptions=True)
+        files = {}
+        for torrent_hash, result in zip(torrent_hashes, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Failed to get files for torrent {torrent_hash}: {str(result)}")
+                result = []
+            files[torrent_hash] = result
+        return files
+
+    async def delete(self, torrent_hashes: List[str], delete_files: bool, batch_size: int = 0) -> List[str]:
+        """
+        Async torrent_utils.remove_torrents: batches are sent concurrently and a failed batch is
+        retried one torrent at a time. Returns the hashes that could not be removed.
+        """
+        hashes = list(dict.fromkeys(torrent_hashes))
+        if not hashes:
+            return []
+        chunk_size = batch_size if batch_size > 0 else len(hashes)
+        chunks = [hashes[start:start + chunk_size] for start in range(0, len(hashes), chunk_size)]
+
+        async def delete_chunk(chunk: List[str]) -> List[str]:
+            data = {'hashes': '|'.join(chunk), 'deleteFiles': str(delete_files).lower()}
+            try:
+                await self.request('POST', 'torrents/delete', data=data)
+                self.logger.debug(f"{len(chunk)} torrents successfully removed.")
+                return []
+            except requests.RequestException as e:
+                if len(chunk) == 1:
+                    self.logger.error(f"Failed to remove torrent {chunk[0]}: {str(e)}")
+                    return chunk
+                self.logger.error(f"Failed to remove batch of {len(chunk)} torrents: {str(e)}. Retrying one by one.")
+                results = await asyncio.gather(*(delete_chunk([torrent_hash]) for torrent_hash in chunk))
+                return [torrent_hash for failed in results for torrent_hash in failed]
+
+        results = await asyncio.gather(*(delete_chunk(chunk) for chunk in chunks))
+        return [torrent_hash for failed in results for torrent_hash in failed]
+
+
+def create_client(login: Login, settings: ApiSettings, logger: Logger,
+                  session: Optional[requests.Session] = None) -> Optional[AsyncQbitClient]:
+    """Return an AsyncQbitClient when '[api] client = asyncio', otherwise None."""
+    if settings.client != 'asyncio':
+        return None
+    return AsyncQbitClient(login, settings, logger, session)
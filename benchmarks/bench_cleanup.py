@@ -0,0 +1,197 @@
+"""
+Benchmark the ratio logger and the cleanup end to end against a local fake qBittorrent WebAPI.
+
+For every library size a synthetic library (see fake_qbittorrent.Library) is created in a
+temporary directory and served by FakeQbittorrent, and the scripts run in stages against it:
+  ratio_log       update_ratio_log records today's ratios into the generated ratio log
+  cleanup_cold    check_space_and_remove_torrents in test mode, hardlink cache empty
+  cleanup_warm    the same again with the hardlink cache (and torrent state mirror) of the first run
+  cleanup_delete  a real run that deletes the selected torrents
+Per stage the wall time, WebAPI requests, peak RSS and its growth over the start of the stage
+are printed, followed by the run summary of the stage. The fake server runs in this process,
+so its share of CPU and memory (mostly the cached torrent list) is included.
+
+Usage: python benchmarks/bench_cleanup.py [--sizes 1000,10000,100000] [--latency-ms 0]
+           [--hardlink-mode api|scan] [--client requests|asyncio] [--stream] [--sync-maindata]
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from configparser import ConfigParser
+from typing import Callable, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instrumentation  # noqa: E402
+import torrent_utils  # noqa: E402
+from fake_qbittorrent import PASSWORD, USERNAME, FakeQbittorrent, Library  # noqa: E402
+from instances import load_instances  # noqa: E402
+from main import check_space_and_remove_torrents  # noqa: E402
+from ratio_history import JSON_LOG_FILE, load_ratio_history  # noqa: E402
+from rules import compile_instances, get_instance_sections  # noqa: E402
+from torrent_ratio_logger import get_logger_settings, update_ratio_log  # noqa: E402
+from torrent_state import get_state_mirror  # noqa: E402
+
+BYTES_PER_MB = 1024**2
+BYTES_PER_GB = 1024**3
+RSS_SAMPLE_SECONDS = 0.005
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size in bytes from /proc, or None where it is not available."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PeakRss:
+    """
+    Samples the RSS in a background thread while the block runs. Without /proc the peak is
+    the process-wide ru_maxrss, which never goes down, so only the first stage is exact.
+    """
+
+    def __enter__(self) -> 'PeakRss':
+        self.start = current_rss()
+        self.peak = self.start
+        self._stop = threading.Event()
+        if self.start is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self) -> None:
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss() or 0)
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._stop.set()
+        if self.start is not None:
+            self._thread.join()
+            self.peak = max(self.peak, current_rss() or 0)
+            return
+        try:
+            import resource
+        except ImportError:
+            return
+        # KiB on Linux, bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.peak = max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def make_config(repo_directory: str, directory: str, fake: FakeQbittorrent, library: Library,
+                args: argparse.Namespace) -> ConfigParser:
+    """The repository's config.ini pointed at the fake server and the library's directory."""
+    config = torrent_utils.load_configuration(repo_directory)
+    for section in get_instance_sections(config):
+        config.remove_section(section)
+    for section in ('login', 'api', 'cleanup', 'path_mapping', 'torrent_state', 'torrent_ratio_logger', 'metrics'):
+        if not config.has_section(section):
+            config.add_section(section)
+    config['login'].update(address=fake.address, username=USERNAME, password=PASSWORD)
+    config['api'].update(client=args.client, stream_torrent_list=str(args.stream))
+    # The library reports its paths as they are on disk
+    config['path_mapping'].update(qbt_prefix=directory, actual_prefix=directory)
+    library_gb = sum(torrent['size'] for torrent in library.torrents) / BYTES_PER_GB
+    free_gb = shutil.disk_usage(directory).free / BYTES_PER_GB
+    config['cleanup'].update(
+        drive_path=directory, hardlink_mode=args.hardlink_mode,
+        categories_to_check_for_space='EX1,EX2,EX3', categories_to_check_for_number='EX4',
+        # Free args.space_share of the library's size for space and trim EX4 by a tenth
+        min_space_gb=f"{free_gb + library_gb * args.space_share:.0f}", download_minspace_gb='',
+        max_torrents_for_categories=str(len(library.torrents) // 4 * 9 // 10))
+    config['torrent_state']['use_sync_maindata'] = str(args.sync_maindata)
+    config['torrent_ratio_logger']['backend'] = 'json'
+    config['metrics'].update(textfile_directory='', http_port='0')
+    return config
+
+
+def run_ratio_log(config: ConfigParser, directory: str, logger: logging.Logger) -> str:
+    max_entries, purge_days = get_logger_settings(config)
+    instances = compile_instances(config, directory)
+    update_ratio_log([(rules.login, get_state_mirror(config, directory, 'torrent_state.json')) for _, rules in instances],
+                     os.path.join(directory, JSON_LOG_FILE), logger, max_entries, purge_days, 'json', instances[0][1].api)
+    return instrumentation.current_run().summary()
+
+
+def run_cleanup(config: ConfigParser, directory: str, logger: logging.Logger, test_mode: bool) -> str:
+    stats = instrumentation.start_run()
+    instances = load_instances(config, directory, logger)
+    try:
+        ratio_history = load_ratio_history(config, directory)
+        result = check_space_and_remove_torrents(instances, logger, test_mode, ratio_history, state_directory=directory)
+        for instance in instances:
+            instance.save()
+    finally:
+        for instance in instances:
+            instance.close()
+    removed = sum(len(candidates.selected) for candidates in result.candidates.values())
+    return f"{stats.summary()} | {removed} torrents {'selected' if test_mode else 'deleted'}"
+
+
+def run_stage(name: str, count: int, fake: FakeQbittorrent, stage: Callable[[], str]) -> None:
+    fake.reset_counts()
+    with PeakRss() as rss:
+        started = time.perf_counter()
+        summary = stage()
+        elapsed = time.perf_counter() - started
+    growth = f"{(rss.peak - rss.start) / BYTES_PER_MB:.1f}" if rss.start is not None else '-'
+    peak = f"{rss.peak / BYTES_PER_MB:.1f}" if rss.peak else '-'
+    print(f"{count:>9} {name:<15} {elapsed:>9.3f} {fake.total_requests():>9} {peak:>13} {growth:>12}")
+    endpoints = ', '.join(f"{endpoint} {requests}" for endpoint, requests in sorted(fake.requests.items()))
+    print(f"{'':>9} {summary}\n{'':>9} Requests: {endpoints or 'none'}")
+
+
+def make_library(count: int, directory: str, seed: int) -> Tuple[Library, float]:
+    started = time.perf_counter()
+    library = Library(directory, count, seed)
+    library.write_ratio_log(os.path.join(directory, JSON_LOG_FILE))
+    return library, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="delay of every fake WebAPI request")
+    parser.add_argument('--hardlink-mode', choices=('api', 'scan'), default='api')
+    parser.add_argument('--client', choices=('requests', 'asyncio'), default='requests')
+    parser.add_argument('--stream', action='store_true', help="set [api] stream_torrent_list")
+    parser.add_argument('--sync-maindata', action='store_true', help="set [torrent_state] use_sync_maindata")
+    parser.add_argument('--space-share', type=float, default=0.05,
+                        help="share of the library's size the cleanup has to free")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    logger = logging.getLogger('bench_cleanup')
+    logger.propagate = False
+    logger.setLevel(logging.ERROR)
+    logger.addHandler(logging.StreamHandler())
+
+    print(f"latency {args.latency_ms:g} ms, hardlink_mode {args.hardlink_mode}, client {args.client}, "
+          f"stream {args.stream}, sync_maindata {args.sync_maindata}")
+    print(f"{'torrents':>9} {'stage':<15} {'wall (s)':>9} {'requests':>9} {'peak RSS (MB)':>13} {'growth (MB)':>12}")
+    for count in [int(size) for size in args.sizes.split(',')]:
+        with tempfile.TemporaryDirectory(prefix='bench_cleanup_') as directory:
+            library, setup_seconds = make_library(count, directory, args.seed)
+            print(f"{count:>9} {'(library)':<15} {setup_seconds:>9.3f} {'':>9} {'':>13} {'':>12}  "
+                  f"{library.hardlinked} hardlinked")
+            fake = FakeQbittorrent(library, args.latency_ms / 1000).start()
+            try:
+                config = make_config(repo_directory, directory, fake, library, args)
+                run_stage('ratio_log', count, fake, lambda: run_ratio_log(config, directory, logger))
+                run_stage('cleanup_cold', count, fake, lambda: run_cleanup(config, directory, logger, True))
+                run_stage('cleanup_warm', count, fake, lambda: run_cleanup(config, directory, logger, True))
+                run_stage('cleanup_delete', count, fake, lambda: run_cleanup(config, directory, logger, False))
+            finally:
+                fake.close()
+
+
+if __name__ == '__main__':
+    main()
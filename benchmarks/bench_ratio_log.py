@@ -0,0 +1,87 @@
+"""
+Benchmark scoring cost against torrent count, before and after loading the ratio log once per run.
+
+"before" re-reads torrent_ratio_log.json for every scored torrent (the old calculate_average_ratio),
+"after" loads it once into a RatioHistory and shares it between all scoring calls.
+
+Usage: python benchmarks/bench_ratio_log.py [--sizes 250,500,1000,2000] [--entries 28] [--before-limit 1000]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torrent_utils  # noqa: E402
+from ratio_history import RatioHistory  # noqa: E402
+from rules import compile_rules  # noqa: E402
+
+
+def make_library(count: int, entries: int, seed: int = 1):
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    torrents, ratio_log = [], {}
+    for i in range(count):
+        torrent_hash = f"{i:040x}"
+        ratio = rng.uniform(0, 5)
+        torrents.append({'hash': torrent_hash, 'name': f"Torrent {i}", 'category': 'EX1',
+                         'size': rng.randint(1, 50) * 1024**3, 'ratio': ratio,
+                         'seeding_time': rng.randint(1, 60) * 86400})
+        ratio_log[torrent_hash] = [{'date': (start + timedelta(days=d)).isoformat(), 'ratio': ratio * d / entries}
+                                   for d in range(entries)]
+    return torrents, ratio_log
+
+
+def score_before(torrents, log_file_path, logger, rules):
+    for torrent in torrents:
+        torrent_utils.calculate_average_ratio(torrent, RatioHistory.load(log_file_path), logger, rules)
+
+
+def score_after(torrents, log_file_path, logger, rules):
+    ratio_history = RatioHistory.load(log_file_path)
+    for torrent in torrents:
+        torrent_utils.calculate_average_ratio(torrent, ratio_history, logger, rules)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='250,500,1000,2000,4000,8000')
+    parser.add_argument('--entries', type=int, default=28)
+    parser.add_argument('--before-limit', type=int, default=1000,
+                        help="skip the quadratic 'before' run above this torrent count")
+    args = parser.parse_args()
+
+    repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = torrent_utils.load_configuration(repo_directory)
+    rules = compile_rules(config, repo_directory)
+    logger = logging.getLogger('bench')
+
+    print(f"{'torrents':>9} {'log size':>10} {'before (s)':>11} {'after (s)':>10}")
+    for count in [int(size) for size in args.sizes.split(',')]:
+        torrents, ratio_log = make_library(count, args.entries)
+        with tempfile.TemporaryDirectory() as tmp:
+            log_file_path = os.path.join(tmp, 'torrent_ratio_log.json')
+            with open(log_file_path, 'w') as file:
+                json.dump(ratio_log, file, indent=4)
+            log_size_mb = os.path.getsize(log_file_path) / 1024**2
+
+            before = '-'
+            if count <= args.before_limit:
+                started = time.perf_counter()
+                score_before(torrents, log_file_path, logger, rules)
+                before = f"{time.perf_counter() - started:.3f}"
+
+            started = time.perf_counter()
+            score_after(torrents, log_file_path, logger, rules)
+            after = f"{time.perf_counter() - started:.3f}"
+        print(f"{count:>9} {log_size_mb:>8.1f}MB {before:>11} {after:>10}")
+
+
+if __name__ == "__main__":
+    main()
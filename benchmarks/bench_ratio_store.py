@@ -0,0 +1,82 @@
+"""
+Benchmark the daily ratio snapshot and the history load of the JSON, SQLite and ring ratio log backends.
+
+Usage: python benchmarks/bench_ratio_store.py [--sizes 10000,50000] [--entries 28]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torrent_ratio_logger  # noqa: E402
+from ratio_history import RatioHistory, RingRatioStore, SqliteRatioStore  # noqa: E402
+from bench_ratio_log import make_library  # noqa: E402
+
+SNAPSHOT_DATE = '2024-02-01'
+PURGE_DAYS = [8, 16, 24]
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def json_snapshot(torrents, log_file_path, max_entries, logger):
+    old_data = torrent_ratio_logger.load_existing_data(log_file_path)
+    new_data, _ = torrent_ratio_logger.process_torrent_data(torrents, old_data, max_entries, PURGE_DAYS)
+    torrent_ratio_logger.save_data(log_file_path, new_data, logger)
+
+
+def ring_snapshot(torrents, ring_path, max_entries):
+    store = RingRatioStore.load(ring_path)
+    store.record_snapshot(torrents, SNAPSHOT_DATE, max_entries, PURGE_DAYS)
+    store.save()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,50000')
+    parser.add_argument('--entries', type=int, default=28)
+    args = parser.parse_args()
+    logger = logging.getLogger('bench')
+
+    print(f"{'torrents':>9} {'backend':>8} {'file size':>10} {'import (s)':>11} {'snapshot (s)':>13} {'load (s)':>9}")
+    for count in [int(size) for size in args.sizes.split(',')]:
+        torrents, ratio_log = make_library(count, args.entries)
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, 'torrent_ratio_log.json')
+            db_path = os.path.join(tmp, 'torrent_ratio_log.db')
+            with open(json_path, 'w') as file:
+                json.dump(ratio_log, file, indent=4)
+
+            snapshot_time, _ = timed(json_snapshot, torrents, json_path, args.entries, logger)
+            load_time, _ = timed(RatioHistory.load, json_path)
+            size_mb = os.path.getsize(json_path) / 1024**2
+            print(f"{count:>9} {'json':>8} {size_mb:>8.1f}MB {'-':>11} {snapshot_time:>13.3f} {load_time:>9.3f}")
+
+            store = SqliteRatioStore(db_path)
+            import_time, _ = timed(store.import_ratio_log, ratio_log)
+            snapshot_time, _ = timed(store.record_snapshot, torrents, SNAPSHOT_DATE, args.entries, PURGE_DAYS)
+            load_time, _ = timed(store.load_history)
+            store.close()
+            size_mb = os.path.getsize(db_path) / 1024**2
+            print(f"{count:>9} {'sqlite':>8} {size_mb:>8.1f}MB {import_time:>11.3f} {snapshot_time:>13.3f} {load_time:>9.3f}")
+
+            ring_path = os.path.join(tmp, 'torrent_ratio_log.ring')
+            store = RingRatioStore(ring_path)
+            import_time, _ = timed(store.import_ratio_log, ratio_log, args.entries)
+            store.save()
+            snapshot_time, _ = timed(ring_snapshot, torrents, ring_path, args.entries)
+            load_time, _ = timed(RingRatioStore.load, ring_path)
+            size_mb = os.path.getsize(ring_path) / 1024**2
+            print(f"{count:>9} {'ring':>8} {size_mb:>8.1f}MB {import_time:>11.3f} {snapshot_time:>13.3f} {load_time:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
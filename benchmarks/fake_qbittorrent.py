@@ -0,0 +1,297 @@
+"""
+In-process fake of the qBittorrent WebAPI endpoints the scripts use, with a synthetic library.
+
+Serves auth/login, torrents/info, torrents/files, torrents/delete and sync/maindata for a
+generated library whose files exist (empty) under a temporary directory, some of them
+hardlinked into a media folder, plus a matching ratio log. Every request can be delayed by a
+fixed latency. Used by bench_cleanup.py; run it directly to point the scripts at it by hand.
+
+Usage: python benchmarks/fake_qbittorrent.py [--torrents 1000] [--port 8080] [--latency-ms 0] [--directory DIR]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# Constants
+API_PATH_PREFIX = '/api/v2/'
+SESSION_COOKIE = 'SID'
+USERNAME = 'admin'
+PASSWORD = 'adminadmin'
+CATEGORIES = ('EX1', 'EX2', 'EX3', 'EX4')
+BYTES_PER_GB = 1024**3
+
+
+class Library:
+    """
+    A synthetic torrent library: /torrents/info objects with the fields qBittorrent sends, the
+    file list of every torrent and a ratio log with 'entries' daily ratios per torrent.
+
+    Files are created empty under <directory>/downloads/<category>; hardlink_share of the
+    completed torrents get a second link under <directory>/media, like an imported download.
+    Sizes are what the torrents report, not what is on disk.
+    """
+
+    def __init__(self, directory: str, count: int, seed: int = 1, hardlink_share: float = 0.1,
+                 downloading_share: float = 0.02, entries: int = 27, categories: Tuple[str, ...] = CATEGORIES):
+        self.directory = directory
+        self.torrents: List[Dict[str, Any]] = []
+        self.files: Dict[str, List[Dict[str, Any]]] = {}
+        self.ratio_log: Dict[str, List[Dict[str, Any]]] = {}
+        self.hardlinked = 0
+        rng = random.Random(seed)
+        media_directory = os.path.join(directory, 'media')
+        os.makedirs(media_directory, exist_ok=True)
+        for category in categories:
+            os.makedirs(os.path.join(directory, 'downloads', category), exist_ok=True)
+
+        now = int(time.time())
+        today = date.today()
+        for i in range(count):
+            torrent_hash = f"{i:040x}"
+            category = categories[i % len(categories)]
+            save_path = os.path.join(directory, 'downloads', category)
+            size = rng.randint(1, 50) * BYTES_PER_GB
+            downloading = rng.random() < downloading_share
+            progress = round(rng.uniform(0.05, 0.95), 4) if downloading else 1
+            seeding_time = 0 if downloading else rng.randint(1, 120) * 86400
+            ratio = 0.0 if downloading else round(rng.uniform(0, 6), 4)
+            name = f"Synthetic.Torrent.{i:06d}"
+
+            # Two in three torrents are a folder of 1-3 files, the rest a single file
+            if i % 3:
+                content_path = os.path.join(save_path, name)
+                file_names = [f"{name}/part{part}.mkv" for part in range(rng.randint(1, 3))]
+                os.makedirs(content_path, exist_ok=True)
+            else:
+                content_path = os.path.join(save_path, f"{name}.mkv")
+                file_names = [f"{name}.mkv"]
+            linked = not downloading and rng.random() < hardlink_share
+            file_size = size // len(file_names)
+            for file_name in file_names:
+                path = os.path.join(save_path, file_name)
+                open(path, 'wb').close()
+                if linked:
+                    os.link(path, os.path.join(media_directory, f"{torrent_hash}-{os.path.basename(path)}"))
+            self.hardlinked += linked
+            self.files[torrent_hash] = [{'index': index, 'name': file_name, 'size': file_size, 'progress': progress,
+                                         'priority': 1, 'is_seed': not downloading, 'availability': 1}
+                                        for index, file_name in enumerate(file_names)]
+
+            added_on = now - seeding_time - rng.randint(600, 86400)
+            self.torrents.append({
+                'hash': torrent_hash, 'infohash_v1': torrent_hash, 'infohash_v2': '', 'name': name,
+                'category': category, 'tags': '', 'size': size, 'total_size': size, 'progress': progress,
+                'state': 'downloading' if downloading else 'stalledUP', 'ratio': ratio,
+                'seeding_time': seeding_time, 'time_active': seeding_time + 3600,
+                'save_path': save_path, 'download_path': '', 'content_path': content_path,
+                'added_on': added_on, 'completion_on': -1 if downloading else added_on + 3600,
+                'amount_left': int(size * (1 - progress)), 'completed': int(size * progress),
+                'downloaded': int(size * progress), 'uploaded': int(size * ratio),
+                'dlspeed': rng.randint(0, 10**7) if downloading else 0, 'upspeed': rng.randint(0, 10**6),
+                'num_seeds': rng.randint(0, 50), 'num_leechs': rng.randint(0, 20),
+                'num_complete': rng.randint(0, 500), 'num_incomplete': rng.randint(0, 50),
+                'eta': 8640000, 'priority': 0, 'seq_dl': False, 'f_l_piece_prio': False,
+                'force_start': False, 'super_seeding': False, 'auto_tmm': True, 'private': True,
+                'tracker': 'https://tracker.example.invalid/announce', 'trackers_count': 1,
+                'last_activity': now - rng.randint(0, 86400), 'seen_complete': now - rng.randint(0, 86400),
+                'max_ratio': -1, 'max_seeding_time': -1, 'ratio_limit': -2, 'seeding_time_limit': -2,
+                'dl_limit': 0, 'up_limit': 0, 'availability': -1, 'magnet_uri': f"magnet:?xt=urn:btih:{torrent_hash}",
+            })
+            if not downloading:
+                # Ratio grows towards today's value over the logged days
+                self.ratio_log[torrent_hash] = [
+                    {'date': (today - timedelta(days=entries - day)).isoformat(),
+                     'ratio': round(ratio * day / entries, 4)}
+                    for day in range(entries)]
+
+    def write_ratio_log(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.ratio_log, file)
+
+
+class QuietThreadingServer(ThreadingMixIn, HTTPServer):
+    """
+    Threading HTTP server (http.server.ThreadingHTTPServer needs Python 3.7) that ignores
+    clients closing their keep-alive connections, so no tracebacks end up between the results.
+    """
+    daemon_threads = True
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeQbittorrent:
+    """
+    Serves a Library on 127.0.0.1 in a background thread (port 0 picks a free port).
+
+    Requests without the session cookie get 403 like qBittorrent; every request sleeps
+    'latency' seconds first. 'requests' counts the requests per endpoint (reset_counts()
+    between stages). Deleted torrents disappear from the list; their files are kept.
+    """
+
+    def __init__(self, library: Library, latency: float = 0.0, port: int = 0):
+        self.library = library
+        self.latency = latency
+        self.requests: Dict[str, int] = {}
+        self._torrents = {torrent['hash']: torrent for torrent in library.torrents}
+        self._removed: List[Tuple[int, str]] = []
+        self._rid = 1
+        self._info_body: Optional[bytes] = None
+        self._lock = threading.Lock()
+        self._sid = f"{random.getrandbits(64):016x}"
+        self._server = QuietThreadingServer(('127.0.0.1', port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> 'FakeQbittorrent':
+        self.info_body()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-qbittorrent', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests = {}
+
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def info_body(self) -> bytes:
+        """The encoded torrent list, cached until the next delete."""
+        with self._lock:
+            if self._info_body is None:
+                self._info_body = json.dumps(list(self._torrents.values())).encode()
+            return self._info_body
+
+    def delete(self, hashes: List[str]) -> None:
+        with self._lock:
+            for torrent_hash in hashes:
+                if self._torrents.pop(torrent_hash, None) is not None:
+                    self._rid += 1
+                    self._removed.append((self._rid, torrent_hash))
+            self._info_body = None
+
+    def maindata(self, rid: int) -> Dict[str, Any]:
+        """A full update for rid 0 or an unknown rid, otherwise the removals since rid."""
+        with self._lock:
+            if 0 < rid <= self._rid:
+                return {'rid': self._rid, 'torrents_removed': [torrent_hash for removed_at, torrent_hash in self._removed
+                                                               if removed_at > rid]}
+            torrents = {torrent_hash: {field: value for field, value in torrent.items() if field != 'hash'}
+                        for torrent_hash, torrent in self._torrents.items()}
+            return {'rid': self._rid, 'full_update': True, 'torrents': torrents,
+                    'server_state': {'free_space_on_disk': 0}}
+
+    def _count(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def _handler(self) -> type:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are separate writes; with Nagle each keep-alive answer waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                self._handle(parse_qs(urlsplit(self.path).query))
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get('Content-Length', 0))
+                self._handle(parse_qs(self.rfile.read(length).decode()))
+
+            def _handle(self, params: Dict[str, List[str]]) -> None:
+                path = urlsplit(self.path).path
+                endpoint = path[len(API_PATH_PREFIX):] if path.startswith(API_PATH_PREFIX) else path
+                fake._count(endpoint)
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if endpoint == 'auth/login':
+                    if params.get('username') == [USERNAME] and params.get('password') == [PASSWORD]:
+                        self._send(200, b'Ok.', f"{SESSION_COOKIE}={fake._sid}; HttpOnly; path=/")
+                    else:
+                        self._send(200, b'Fails.')
+                    return
+                if f"{SESSION_COOKIE}={fake._sid}" not in (self.headers.get('Cookie') or ''):
+                    self._send(403, b'Forbidden')
+                    return
+
+                if endpoint == 'torrents/info':
+                    self._send(200, fake.info_body())
+                elif endpoint == 'torrents/files':
+                    files = fake.library.files.get(params.get('hash', [''])[0])
+                    if files is None:
+                        self._send(404, b'Torrent hash was not found')
+                    else:
+                        self._send(200, json.dumps(files).encode())
+                elif endpoint == 'torrents/delete' and self.command == 'POST':
+                    fake.delete(params.get('hashes', [''])[0].split('|'))
+                    self._send(200)
+                elif endpoint == 'sync/maindata':
+                    self._send(200, json.dumps(fake.maindata(int(params.get('rid', ['0'])[0]))).encode())
+                else:
+                    self._send(404, b'Not found')
+
+            def _send(self, status: int, body: bytes = b'', cookie: Optional[str] = None) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json' if body[:1] in (b'[', b'{') else 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
+                if cookie:
+                    self.send_header('Set-Cookie', cookie)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--torrents', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--directory', help="where to create the library (default: a temporary directory)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        directory = args.directory or temporary_directory
+        library = Library(directory, args.torrents)
+        library.write_ratio_log(os.path.join(directory, 'torrent_ratio_log.json'))
+        fake = FakeQbittorrent(library, args.latency_ms / 1000, args.port).start()
+        print(f"Serving {args.torrents} torrents ({library.hardlinked} hardlinked) on {fake.address} "
+              f"as {USERNAME}/{PASSWORD}; files and ratio log in {directory}. Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fake.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import os
+import signal
+import threading
+import time
+from typing import Dict, List, Any, Optional, Callable
+from logging import Logger
+from configparser import ConfigParser
+import torrent_utils
+import torrent_ratio_logger
+import instrumentation
+from ratio_history import get_ratio_log_location, load_ratio_history
+from instances import load_instances, map_instances
+from metrics import MetricsExporter, cleanup_metrics, ratio_log_metrics
+
+# Constants
+DEFAULT_CLEANUP_INTERVAL_MINUTES = 60.0
+DEFAULT_RATIO_LOG_INTERVAL_HOURS = 24.0
+
+
+class CleanupDaemon:
+    """
+    Long-running replacement for the main.py and torrent_ratio_logger.py cron jobs.
+
+    The logged-in sessions, the parsed rules, the ratio history, the hardlink caches and the
+    torrent state mirrors of every instance stay in memory between cycles. The space/count cleanup runs every
+    'cleanup_interval_minutes' and the ratio snapshot every 'ratio_log_interval_hours' from
+    the [daemon] section. SIGTERM and SIGINT stop the daemon after the current cycle, or after the
+    current batch of a paced deletion, whose remaining deletions are resumed on the next start.
+    """
+
+    def __init__(self, config: ConfigParser, logger: Logger, handler: Any, test_mode: bool, script_directory: str,
+                 cleanup: Callable[..., None], profile: bool = False):
+        self.config = config
+        self.cleanup = cleanup
+        self.profile = profile
+        self.logger = logger
+        self.handler = handler
+        self.test_mode = test_mode
+        self.script_directory = script_directory
+        self.cleanup_interval = config.getfloat('daemon', 'cleanup_interval_minutes',
+                                                fallback=DEFAULT_CLEANUP_INTERVAL_MINUTES) * 60
+        self.ratio_log_interval = config.getfloat('daemon', 'ratio_log_interval_hours',
+                                                  fallback=DEFAULT_RATIO_LOG_INTERVAL_HOURS) * 3600
+        self.ratio_log_backend, self.ratio_log_path = get_ratio_log_location(config, script_directory)
+        self.max_entries, self.purge_days = torrent_ratio_logger.get_logger_settings(config)
+        self.stop_event = threading.Event()
+
+        self.instances = load_instances(config, script_directory, logger)
+        for instance in self.instances:
+            login = instance.rules.login
+            torrent_utils.login_to_qbittorrent(instance.session, login.address, login.username, login.password, instance.logger)
+            torrent_utils.enable_auto_relogin(instance.session, login.address, login.username, login.password, instance.logger)
+        self.ratio_history = load_ratio_history(config, script_directory)
+        self.exporter = MetricsExporter(config, logger)
+
+    def stop(self, signum: Optional[int] = None, frame: Any = None) -> None:
+        """Ask the daemon to exit after the current cycle."""
+        self.stop_event.set()
+
+    def run(self) -> None:
+        """Run cleanup and ratio snapshot cycles until stopped."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.exporter.start_http()
+        self.logger.info(f"Daemon started: cleanup every {self.cleanup_interval / 60:g} min, "
+                         f"ratio log every {self.ratio_log_interval / 3600:g} h")
+        self.flush_log()
+
+        next_ratio_log = time.monotonic()
+        next_cleanup = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                if now >= next_ratio_log:
+                    self.run_ratio_snapshot()
+                    next_ratio_log = now + self.ratio_log_interval
+                if now >= next_cleanup and not self.stop_event.is_set():
+                    self.run_cleanup()
+                    next_cleanup = now + self.cleanup_interval
+                self.stop_event.wait(max(0.0, min(next_ratio_log, next_cleanup) - time.monotonic()))
+        finally:
+            for instance in self.instances:
+                instance.save()
+                instance.close()
+            self.exporter.close()
+            self.logger.info("Daemon stopped")
+            self.flush_log()
+
+    def fetch_torrents(self) -> List[Dict[str, Any]]:
+        """Torrents of all instances. Fails if any instance fails, so its history is not purged."""
+        torrent_lists = map_instances(lambda instance: list(instance.fetch_torrents()), self.instances, strict=True)
+        return [torrent for torrents in torrent_lists.values() for torrent in torrents]
+
+    def run_ratio_snapshot(self) -> None:
+        stats = instrumentation.start_run()
+        history = None
+        torrents: List[Dict[str, Any]] = []
+        try:
+            with instrumentation.phase('fetch'):
+                torrents = self.fetch_torrents()
+            with instrumentation.phase('ratio_log'):
+                history = torrent_ratio_logger.record_ratio_snapshot(torrents, self.ratio_log_path, self.logger,
+                                                                     self.max_entries, self.purge_days,
+                                                                     self.ratio_log_backend)
+            self.ratio_history = history
+        except Exception as e:
+            self.logger.error(f"Failed to update ratio log: {e}")
+        finally:
+            self.exporter.publish('ratio_log', ratio_log_metrics(stats, history, self.ratio_log_path, len(torrents)))
+            self.flush_log()
+
+    def run_cleanup(self) -> None:
+        """One cleanup cycle. With --profile every cycle overwrites the profile of the previous one."""
+        for instance in self.instances:
+            instance.hardlink_checker.reset()
+        stats = instrumentation.start_run()
+        result = None
+        with instrumentation.profiled(self.profile, os.path.join(self.script_directory, instrumentation.PROFILE_FILE_PREFIX)):
+            try:
+                result = self.cleanup(self.instances, self.logger, self.test_mode, self.ratio_history, self.stop_event)
+                for instance in self.instances:
+                    instance.save()
+            except Exception as e:
+                self.logger.error(f"An error occurred: {e}")
+                result = None
+            finally:
+                self.exporter.publish('cleanup', cleanup_metrics(stats, result, self.test_mode))
+                self.logger.info(stats.summary())
+                self.flush_log()
+
+    def flush_log(self) -> None:
+        self.handler.write_log_entries()
+
+
+def run_daemon(config: ConfigParser, logger: Logger, handler: Any, test_mode: bool, script_directory: str,
+               cleanup: Callable[..., None], profile: bool = False) -> None:
+    """
+    Start the daemon and block until it receives SIGTERM or SIGINT.
+    cleanup is main.check_space_and_remove_torrents, passed in because main.py starts the daemon.
+    """
+    CleanupDaemon(config, logger, handler, test_mode, script_directory, cleanup, profile).run()
@@ -0,0 +1,247 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Iterable, Iterator, NamedTuple, Optional
+from logging import Logger
+import requests
+try:
+    import fcntl
+except ImportError:  # Windows locks the queue with msvcrt instead
+    fcntl = None
+    import msvcrt
+import torrent_utils
+import instrumentation
+from instances import Instance
+from rules import DeletePacing
+
+# Constants
+PENDING_DELETES_FILE = 'pending_deletes.json'
+LOCK_SUFFIX = '.lock'
+BYTES_PER_MB = 1024**2
+BYTES_PER_GB = 1024**3
+
+
+class PendingDelete(NamedTuple):
+    """
+    A torrent waiting to be deleted. Space removals carry the disk they free space on and the
+    free space at which the disk needs no further removals; entries without a mount point
+    (count removals) are always done.
+    """
+    instance: str
+    hash: str
+    name: str
+    size: int
+    reason: str
+    mount_point: str = ''
+    target_free_gb: float = 0.0
+
+
+def delete_torrents(instance: Instance, torrent_hashes: List[str]) -> List[str]:
+    """Delete torrents and their files in as few requests as possible. Returns the hashes that failed."""
+    rules = instance.rules
+    if instance.client is not None:
+        return instance.client.run(instance.client.delete(torrent_hashes, True, rules.delete_batch_size))
+    return torrent_utils.remove_torrents(instance.session, rules.login.address, torrent_hashes, True, instance.logger,
+                                         rules.delete_batch_size)
+
+
+@contextmanager
+def queue_lock(path: str, enabled: bool = True) -> Iterator[bool]:
+    """
+    Hold an exclusive lock on the queue at path (in path + '.lock') while the block runs. Yields
+    False without waiting if another run holds it, or if not enabled (test runs). The lock is
+    released by the OS if the process dies, so a crashed run never leaves it stale.
+    """
+    if not enabled:
+        yield False
+        return
+    with open(path + LOCK_SUFFIX, 'a') as file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class DeletionQueue:
+    """
+    Deletions not yet released to qBittorrent, persisted in pending_deletes.json after every
+    batch so a run that is interrupted (or a daemon that is stopped) resumes with the next run.
+    Count removals are released first: they are due anyway, and the space they free may make
+    some of the space removals unnecessary.
+    """
+
+    def __init__(self, path: str, logger: Logger):
+        self.path = path
+        self.logger = logger
+        self.entries: List[PendingDelete] = []
+
+    @classmethod
+    def load(cls, path: str, logger: Logger) -> 'DeletionQueue':
+        queue = cls(path, logger)
+        try:
+            with open(path, 'r') as file:
+                instrumentation.count('json_loads')
+                queue.entries = [PendingDelete(**entry) for entry in json.load(file)]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Error reading pending deletes from {path}: {e}")
+        return queue
+
+    def save(self) -> None:
+        """Write the queue atomically; the file is removed once the queue is empty."""
+        try:
+            if not self.entries:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump([entry._asdict() for entry in self.entries], file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.logger.error(f"Error saving pending deletes to {self.path}: {e}")
+
+    def add(self, entries: Iterable[PendingDelete]) -> None:
+        queued = {(entry.instance, entry.hash) for entry in self.entries}
+        self.entries.extend(entry for entry in entries if (entry.instance, entry.hash) not in queued)
+        self.entries.sort(key=lambda entry: bool(entry.mount_point))
+        self.save()
+
+    def remove(self, entries: Iterable[PendingDelete]) -> None:
+        removed = set(entries)
+        self.entries = [entry for entry in self.entries if entry not in removed]
+        self.save()
+
+    def next_batch(self, pacing: DeletePacing) -> List[PendingDelete]:
+        """
+        The entries to release together: at most torrents_per_interval, and as many as fit the
+        interval's byte budget. The first entry is always released, even if it alone exceeds it.
+        """
+        byte_budget = pacing.rate_mb_per_second * BYTES_PER_MB * pacing.interval_seconds
+        batch: List[PendingDelete] = []
+        batch_bytes = 0
+        for entry in self.entries:
+            if batch and pacing.torrents_per_interval and len(batch) >= pacing.torrents_per_interval:
+                break
+            if batch and byte_budget and batch_bytes + entry.size > byte_budget:
+                break
+            batch.append(entry)
+            batch_bytes += entry.size
+        return batch
+
+    def drop_satisfied(self) -> List[PendingDelete]:
+        """Drop the space removals of every disk whose free space reached their target, and return them."""
+        free_space: Dict[str, Optional[float]] = {}
+        for mount_point in {entry.mount_point for entry in self.entries if entry.mount_point}:
+            try:
+                free_space[mount_point] = torrent_utils.get_free_space(mount_point)
+            except OSError as e:
+                self.logger.warning(f"Could not check free space of {mount_point}: {e}")
+                free_space[mount_point] = None
+        dropped = [entry for entry in self.entries if entry.mount_point
+                   and free_space[entry.mount_point] is not None
+                   and free_space[entry.mount_point] >= entry.target_free_gb]
+        for mount_point in sorted({entry.mount_point for entry in dropped}):
+            kept = [entry for entry in dropped if entry.mount_point == mount_point]
+            self.logger.info(f"{mount_point}: {free_space[mount_point]:.2f} GB free, target reached; "
+                             f"keeping {len(kept)} torrents selected for space")
+        if dropped:
+            self.remove(dropped)
+        return dropped
+
+
+def pause_seconds(pacing: DeletePacing, batch_bytes: int) -> float:
+    """Wait one interval after a batch, or longer if the batch exceeded the byte rate on its own."""
+    if pacing.rate_mb_per_second > 0:
+        return max(pacing.interval_seconds, batch_bytes / (pacing.rate_mb_per_second * BYTES_PER_MB))
+    return pacing.interval_seconds
+
+
+def run_deletions(queue: DeletionQueue, instances: List[Instance], pacing: DeletePacing, logger: Logger,
+                  stop_event: Optional[threading.Event] = None) -> List[PendingDelete]:
+    """
+    Release the queued deletions batch by batch under the pacing budget. Before every batch the
+    free space of the disks is polled, so space removals stop as soon as their disk reaches its
+    target instead of trusting the planned estimate; qBittorrent deletes the files in the
+    background, so the pause between batches also lets the free space catch up.
+    Returns the entries that were deleted; space removals that were dropped, failed deletes and,
+    when stop_event is set, the deletions that stay queued for the next run are not among them.
+    """
+    instances_by_name = {instance.name: instance for instance in instances}
+    dropped: List[PendingDelete] = []
+    deleted: List[PendingDelete] = []
+    batches = 0
+    with instrumentation.phase('delete'):
+        while queue.entries:
+            dropped.extend(queue.drop_satisfied())
+            batch = queue.next_batch(pacing)
+            if not batch:
+                break
+            by_instance: Dict[str, List[PendingDelete]] = {}
+            for entry in batch:
+                by_instance.setdefault(entry.instance, []).append(entry)
+            for name, entries in by_instance.items():
+                instance = instances_by_name.get(name)
+                if instance is None:
+                    logger.warning(f"Dropping {len(entries)} pending deletes of unknown instance '{name}'")
+                    continue
+                # A failed hash is logged by delete_torrents and not retried: it may no longer exist
+                failed = set(delete_torrents(instance, [entry.hash for entry in entries]))
+                deleted.extend(entry for entry in entries if entry.hash not in failed)
+            batch_bytes = sum(entry.size for entry in batch)
+            batches += 1
+            queue.remove(batch)
+            logger.debug(f"Deletion batch {batches}: {len(batch)} torrents, {batch_bytes / BYTES_PER_GB:.2f} GB, "
+                         f"{len(queue.entries)} pending")
+            if not queue.entries or not pacing.enabled:
+                continue
+            pause = pause_seconds(pacing, batch_bytes)
+            if stop_event is None:
+                time.sleep(pause)
+            elif stop_event.wait(pause):
+                break
+
+    if batches:
+        deleted_gb = sum(entry.size for entry in deleted) / BYTES_PER_GB
+        logger.info(f"Paced deletion: {len(deleted)} torrents ({deleted_gb:.2f} GB) deleted in {batches} "
+                    f"batches, {len(dropped)} kept" +
+                    (f", {len(queue.entries)} pending for the next run" if queue.entries else ''))
+    return deleted
+
+
+def resume_pending(instances: List[Instance], path: str, logger: Logger,
+                   stop_event: Optional[threading.Event] = None) -> None:
+    """
+    Finish the deletions an interrupted run left in the queue, under the current pacing budget.
+    This runs before the torrent lists are fetched, so the instances with pending deletes log in first.
+    """
+    queue = DeletionQueue.load(path, logger)
+    if not queue.entries or not instances:
+        return
+    pending_instances = {entry.instance for entry in queue.entries}
+    for instance in instances:
+        if instance.name not in pending_instances:
+            continue
+        try:
+            instance.login()
+        except (requests.RequestException, ValueError) as e:
+            instance.logger.error(f"Could not log in to resume pending deletes, keeping them queued: {e}")
+            return
+    logger.info(f"Resuming {len(queue.entries)} pending deletes of an interrupted run")
+    run_deletions(queue, instances, instances[0].rules.delete_pacing, logger, stop_event)
@@ -0,0 +1,171 @@
+import json
+import os
+import statistics
+import time
+from typing import Dict, List, Any, NamedTuple, Optional
+from logging import Logger
+import instrumentation
+from rules import ForecastSettings
+from space_planner import Disk
+
+# Constants
+FORECAST_FILE = 'space_forecast.json'
+MAX_SAMPLES_PER_DISK = 500
+BYTES_PER_GB = 1024**3
+SECONDS_PER_HOUR = 3600
+# qBittorrent reports this eta for downloads that are not expected to finish
+ETA_INFINITY = 8640000
+DEFAULT_RUN_INTERVAL_HOURS = 1.0
+
+
+class Sample(NamedTuple):
+    """One observation of a disk, taken at every cleanup run."""
+    time: float
+    free_gb: float
+    download_rate: float
+    remaining_gb: float
+
+
+class Forecast(NamedTuple):
+    """Projected use of a disk over the horizon and the space to free ahead of time in this run."""
+    use_gb_per_hour: float
+    projected_free_gb: float
+    hours_to_min_space: Optional[float]
+    ahead_gb: float
+
+
+def project_downloads_gb(downloads: List[Dict[str, Any]], horizon_seconds: float) -> float:
+    """GB the running downloads will write within the horizon: all of it if their eta is within it, else dlspeed times it."""
+    projected = 0.0
+    for torrent in downloads:
+        remaining = torrent['size'] * (1 - torrent['progress'])
+        eta = torrent.get('eta', ETA_INFINITY)
+        if 0 <= eta < ETA_INFINITY and eta <= horizon_seconds:
+            projected += remaining
+        else:
+            projected += min(remaining, (torrent.get('dlspeed') or 0) * horizon_seconds)
+    return projected / BYTES_PER_GB
+
+
+def free_space_trend(samples: List[Sample]) -> float:
+    """GB per hour the free space shrank over the samples (least-squares slope), 0 if it grew."""
+    if len(samples) < 3 or samples[-1].time - samples[0].time <= 0:
+        return 0.0
+    hours = [(sample.time - samples[0].time) / SECONDS_PER_HOUR for sample in samples]
+    mean_hours = statistics.mean(hours)
+    mean_free = statistics.mean(sample.free_gb for sample in samples)
+    variance = sum((hour - mean_hours) ** 2 for hour in hours)
+    if variance == 0:
+        return 0.0
+    slope = sum((hour - mean_hours) * (sample.free_gb - mean_free) for hour, sample in zip(hours, samples)) / variance
+    return max(0.0, -slope)
+
+
+def run_interval_hours(samples: List[Sample]) -> float:
+    """Typical time between cleanup runs, from the spacing of the samples."""
+    gaps = [(later.time - earlier.time) / SECONDS_PER_HOUR for earlier, later in zip(samples, samples[1:])]
+    gaps = [gap for gap in gaps if gap > 0]
+    return statistics.median(gaps) if gaps else DEFAULT_RUN_INTERVAL_HOURS
+
+
+def forecast_disk(disk: Disk, samples: List[Sample], settings: ForecastSettings) -> Forecast:
+    """
+    Project the free space of the disk over horizon_hours and decide how much to free now.
+
+    The use over the horizon is the larger of what the running downloads will write (from
+    their dlspeed and eta, or the download rate averaged over the samples if that is higher)
+    and the trend of the sampled free space, which also catches downloads that have not
+    started yet. If the projection ends below min_space_gb, the shortfall is spread over the
+    runs left until the disk crosses it, at most max_step_gb per run, so it is freed in small
+    steps; if the disk crosses before the next run the whole shortfall is freed now.
+    """
+    horizon_hours = settings.horizon_hours
+    horizon_seconds = horizon_hours * SECONDS_PER_HOUR
+    remaining_gb = disk.remaining_download_gb
+    downloads_gb = project_downloads_gb(disk.downloads, horizon_seconds)
+    average_rate = statistics.mean(sample.download_rate for sample in samples) if samples else 0.0
+    downloads_gb = max(downloads_gb, min(remaining_gb, average_rate * horizon_seconds / BYTES_PER_GB))
+    trend_gb = free_space_trend(samples) * horizon_hours
+    use_gb = max(downloads_gb, trend_gb)
+    use_per_hour = use_gb / horizon_hours if horizon_hours > 0 else 0.0
+
+    min_space_gb = disk.min_space_gb or 0.0
+    projected_free = disk.free_space - use_gb
+    hours_to_min_space = None
+    if use_per_hour > 0:
+        hours_to_min_space = max(0.0, (disk.free_space - min_space_gb) / use_per_hour)
+
+    # The current deficit is freed reactively anyway; only the part still to come is scheduled
+    lead_gb = max(0.0, min_space_gb - projected_free) - max(0.0, min_space_gb - disk.free_space)
+    ahead_gb = 0.0
+    if lead_gb > 0 and hours_to_min_space is not None:
+        interval = run_interval_hours(samples)
+        if hours_to_min_space <= interval:
+            ahead_gb = lead_gb
+        else:
+            ahead_gb = min(lead_gb / (hours_to_min_space / interval), settings.max_step_gb or lead_gb)
+    return Forecast(use_per_hour, projected_free, hours_to_min_space, ahead_gb)
+
+
+class SpaceForecaster:
+    """
+    Samples every disk's free space and download rate at each cleanup run into space_forecast.json
+    (the last history_hours, per mount point) and schedules removals ahead of time from them.
+    """
+
+    def __init__(self, path: str, settings: ForecastSettings, logger: Logger):
+        self.path = path
+        self.settings = settings
+        self.logger = logger
+        self.samples: Dict[str, List[Sample]] = {}
+        try:
+            with open(path, 'r') as file:
+                instrumentation.count('json_loads')
+                self.samples = {mount_point: [Sample(*sample) for sample in samples]
+                                for mount_point, samples in json.load(file).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Error reading space forecast samples from {path}: {e}")
+
+    def apply(self, disks: List[Disk], now: Optional[float] = None, record: bool = True) -> Dict[str, Forecast]:
+        """
+        Record a sample of every disk, then set disk.forecast_gb to the space to free now. With
+        record=False (test runs) the sample is only used for this forecast, so dry runs do not
+        shorten the run interval or skew the trend of later runs.
+        """
+        now = time.time() if now is None else now
+        forecasts = {}
+        for disk in disks:
+            if record:
+                samples = self.samples.setdefault(disk.mount_point, [])
+            else:
+                samples = list(self.samples.get(disk.mount_point, []))
+            samples.append(Sample(now, disk.free_space, sum(torrent.get('dlspeed') or 0 for torrent in disk.downloads),
+                                  disk.remaining_download_gb))
+            oldest = now - self.settings.history_hours * SECONDS_PER_HOUR
+            samples[:] = [sample for sample in samples if sample.time >= oldest][-MAX_SAMPLES_PER_DISK:]
+            if not disk.min_space_gb:
+                # min_space_gb = 0 disables space removals
+                continue
+            forecast = forecast_disk(disk, samples, self.settings)
+            forecasts[disk.mount_point] = forecast
+            disk.forecast_gb = max(0.0, disk.min_space_gb - disk.free_space) + forecast.ahead_gb
+            if forecast.hours_to_min_space is not None and forecast.ahead_gb > 0:
+                self.logger.info(f"Forecast {disk.mount_point}: using {forecast.use_gb_per_hour:.1f} GB/h, "
+                                 f"min_space_gb reached in {forecast.hours_to_min_space:.1f} h; "
+                                 f"freeing {forecast.ahead_gb:.1f} GB ahead of time")
+            else:
+                self.logger.debug(f"Forecast {disk.mount_point}: using {forecast.use_gb_per_hour:.1f} GB/h, "
+                                  f"{forecast.projected_free_gb:.1f} GB free in {self.settings.horizon_hours:g} h")
+        return forecasts
+
+    def save(self) -> None:
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump({mount_point: [list(sample) for sample in samples]
+                           for mount_point, samples in self.samples.items()}, file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.logger.error(f"Error saving space forecast samples to {self.path}: {e}")
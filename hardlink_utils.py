@@ -0,0 +1,288 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable, Iterable, Optional, Tuple, TYPE_CHECKING
+from logging import Logger
+import requests
+from requests.adapters import HTTPAdapter
+import torrent_utils
+import instrumentation
+from rules import Rules
+
+if TYPE_CHECKING:
+    from async_client import AsyncQbitClient
+
+# Constants
+CACHE_PRUNE_SECONDS = 30 * 86400
+
+
+def scan_save_path(save_path: str, logger: Logger) -> Dict[str, int]:
+    """
+    Walk a save path once and return {top-level entry name: highest st_nlink below it}.
+
+    A torrent's content lives in one top-level entry of its save path (its root folder or,
+    for single-file torrents, the file itself), so this is all the hardlink verdict needs.
+    """
+    index: Dict[str, int] = {}
+    instrumentation.count('stat_calls')
+    try:
+        top_entries = list(os.scandir(save_path))
+    except OSError as e:
+        logger.warning(f"Could not scan save path {save_path}: {str(e)}")
+        return index
+
+    for top_entry in top_entries:
+        max_links = 1
+        stack = [top_entry]
+        while stack:
+            entry = stack.pop()
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    instrumentation.count('stat_calls')
+                    stack.extend(os.scandir(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    instrumentation.count('stat_calls')
+                    max_links = max(max_links, entry.stat(follow_symlinks=False).st_nlink)
+            except OSError as e:
+                logger.warning(f"Could not scan {entry.path}: {str(e)}")
+        index[top_entry.name] = max_links
+    return index
+
+
+def load_hardlink_cache(cache_file_path: str) -> Dict[str, Dict[str, Any]]:
+    """Load the hardlink cache from file."""
+    try:
+        with open(cache_file_path, 'r') as file:
+            instrumentation.count('json_loads')
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON from {cache_file_path}: {str(e)}")
+        return {}
+
+
+def save_hardlink_cache(cache_file_path: str, cache: Dict[str, Dict[str, Any]]) -> None:
+    """Atomically write the hardlink cache to file."""
+    temp_path = cache_file_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(cache, file)
+    os.replace(temp_path, cache_file_path)
+
+
+class HardlinkChecker:
+    """
+    Hardlink detection for a whole run.
+
+    Every hash is checked at most once per run. File-list fetches and stats for the
+    unchecked torrents run on a bounded thread pool, and the verdicts are cached on disk
+    together with the (path, st_ino, st_mtime) of every file:
+    - within 'hardlink_cache_hours' a cached verdict is reused without any API call or stat
+    - after that the cached file list is re-stat'ed; the files API is only queried again
+      when a file disappeared or its inode/mtime changed
+
+    With 'hardlink_mode = scan' the files API is not used at all: every distinct save path
+    is walked once per run and each verdict is a dictionary lookup of the torrent's
+    content_path. Torrents without a usable content_path fall back to the API check.
+
+    With an AsyncQbitClient ('[api] client = asyncio') the missing file lists are fetched
+    concurrently through the client instead of one blocking call per worker thread.
+    """
+
+    def __init__(self, session: requests.Session, api_address: str, logger: Logger,
+                 rules: Rules, cache_file_path: Optional[str] = None, client: Optional['AsyncQbitClient'] = None):
+        self.session = session
+        self.client = client
+        self.api_address = api_address
+        self.logger = logger
+        self.path_mapping = rules.path_mapping
+        self.enabled = rules.check_hardlinks
+        self.max_workers = rules.hardlink_workers
+        self.cache_seconds = rules.hardlink_cache_hours * 3600
+        self.mode = rules.hardlink_mode
+        self.cache_file_path = cache_file_path
+        self._cache = load_hardlink_cache(cache_file_path) if cache_file_path and self.enabled else {}
+        self._results: Dict[str, bool] = {}
+        self._scan_index: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        if self.enabled and client is None:
+            # One pooled connection per worker instead of urllib3's default of 10
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount(api_address, adapter)
+
+    def reset(self) -> None:
+        """Forget the per-run results so the next run re-evaluates every torrent."""
+        self._results = {}
+        self._scan_index = {}
+
+    def is_hardlinked(self, torrent: Dict[str, Any]) -> bool:
+        """Return True if any file of the torrent has more than one hardlink."""
+        return self.check_many([torrent])[torrent['hash']]
+
+    def check_many(self, torrents: Iterable[Dict[str, Any]]) -> Dict[str, bool]:
+        """Return {hash: hardlinked} for the given torrents, checking unseen hashes in parallel."""
+        with instrumentation.phase('hardlinks'):
+            return self._check_many(list(torrents))
+
+    def _check_many(self, torrents: List[Dict[str, Any]]) -> Dict[str, bool]:
+        if not self.enabled:
+            return {torrent['hash']: False for torrent in torrents}
+
+        pending = {}
+        for torrent in torrents:
+            if torrent['hash'] not in self._results:
+                pending[torrent['hash']] = torrent
+        if pending and self.mode == 'scan':
+            for torrent_hash, hardlinked in self._check_by_scan(list(pending.values())).items():
+                self._results[torrent_hash] = hardlinked
+                del pending[torrent_hash]
+        if pending and self.client is not None:
+            # Stat cached entries locally, then fetch all missing file lists concurrently
+            verdicts = dict(zip(pending.keys(), self._map(self._check_cached, list(pending.values()))))
+            missing = [torrent_hash for torrent_hash, verdict in verdicts.items() if verdict is None]
+            if missing:
+                files = self.client.run(self.client.torrent_files_many(missing))
+                for torrent_hash in missing:
+                    verdicts[torrent_hash] = self._check_files(pending[torrent_hash], files[torrent_hash])
+            self._results.update(verdicts)
+        elif pending:
+            self._results.update(zip(pending.keys(), self._map(self._check, list(pending.values()))))
+
+        return {torrent['hash']: self._results[torrent['hash']] for torrent in torrents}
+
+    def _map(self, function: Callable[[Dict[str, Any]], Any], torrents: List[Dict[str, Any]]) -> List[Any]:
+        if len(torrents) == 1 or self.max_workers == 1:
+            return [function(torrent) for torrent in torrents]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(torrents))) as executor:
+            return list(executor.map(function, torrents))
+
+    def save(self) -> None:
+        """Write the cache to disk, dropping entries that have not been checked for a long time."""
+        if not self.cache_file_path or not self.enabled:
+            return
+        cutoff = time.time() - CACHE_PRUNE_SECONDS
+        with self._lock:
+            cache = {torrent_hash: entry for torrent_hash, entry in self._cache.items() if entry['checked'] >= cutoff}
+        try:
+            save_hardlink_cache(self.cache_file_path, cache)
+        except OSError as e:
+            self.logger.error(f"Error saving hardlink cache: {str(e)}")
+
+    def _check_by_scan(self, torrents: List[Dict[str, Any]]) -> Dict[str, bool]:
+        """Return verdicts for the torrents whose content_path can be looked up in a save path scan."""
+        located: Dict[str, Tuple[str, str]] = {}
+        for torrent in torrents:
+            save_path = torrent.get('save_path', '')
+            content_path = torrent.get('content_path', '')
+            if not save_path or not content_path:
+                continue
+            actual_save_path = os.path.normpath(self.path_mapping.translate(save_path))
+            actual_content_path = os.path.normpath(self.path_mapping.translate(content_path))
+            relative_path = os.path.relpath(actual_content_path, actual_save_path)
+            if relative_path == os.curdir or relative_path.startswith(os.pardir):
+                # Content is not below the save path (e.g. still in an incomplete folder)
+                continue
+            located[torrent['hash']] = (actual_save_path, relative_path.split(os.sep, 1)[0])
+
+        unscanned = sorted({save_path for save_path, _ in located.values()} - self._scan_index.keys())
+        if unscanned:
+            workers = min(self.max_workers, len(unscanned))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                indexes = executor.map(lambda path: scan_save_path(path, self.logger), unscanned)
+                self._scan_index.update(zip(unscanned, indexes))
+
+        verdicts = {}
+        for torrent in torrents:
+            if torrent['hash'] not in located:
+                continue
+            save_path, top_entry = located[torrent['hash']]
+            links = self._scan_index[save_path].get(top_entry)
+            if links is None:
+                # Content not on disk; like the API check, a missing file is not a hardlink
+                verdicts[torrent['hash']] = False
+                continue
+            # st_nlink > 1 means the file has multiple hardlinks
+            verdicts[torrent['hash']] = links > 1
+            if links > 1:
+                self.logger.debug(f"Hardlinked file detected: {torrent['name'][:60]} (links: {links})")
+        return verdicts
+
+    def _check(self, torrent: Dict[str, Any]) -> bool:
+        verdict = self._check_cached(torrent)
+        if verdict is None:
+            files = torrent_utils.get_torrent_files(self.session, self.api_address, torrent['hash'], self.logger)
+            verdict = self._check_files(torrent, files)
+        return verdict
+
+    def _check_cached(self, torrent: Dict[str, Any]) -> Optional[bool]:
+        """Return the verdict from the cache (re-stat'ing it if expired), or None when the file list is needed."""
+        try:
+            save_path = torrent.get('save_path', '')
+            if not save_path:
+                self.logger.warning(f"No save path found for torrent: {torrent['name']}")
+                return False
+
+            # Translate path from qBittorrent's view to actual filesystem path
+            actual_save_path = self.path_mapping.translate(save_path)
+            now = time.time()
+
+            with self._lock:
+                entry = self._cache.get(torrent['hash'])
+            if entry and entry['save_path'] == actual_save_path:
+                if now - entry['checked'] < self.cache_seconds:
+                    return entry['hardlinked']
+                stats = self._stat_files([path for path, _, _ in entry['files']])
+                if stats is not None and all(stat is not None and stat[:2] == (ino, mtime) for stat, (_, ino, mtime) in zip(stats, entry['files'])):
+                    return self._store(torrent, actual_save_path, entry['files'], stats, now)
+            return None
+        except Exception as e:
+            self.logger.error(f"Error checking hardlinks for torrent {torrent['name']}: {str(e)}")
+            return False
+
+    def _check_files(self, torrent: Dict[str, Any], files: List[Dict[str, Any]]) -> bool:
+        """Stat a freshly fetched file list and cache the verdict."""
+        try:
+            if not files:
+                # Either the API call failed or the torrent has no files; do not cache either case
+                return False
+            actual_save_path = self.path_mapping.translate(torrent['save_path'])
+            paths = [os.path.join(actual_save_path, file_info.get('name', '')) for file_info in files]
+            stats = self._stat_files(paths, skip_missing=True)
+            file_entries = [[path, stat[0], stat[1]] for path, stat in zip(paths, stats) if stat is not None]
+            return self._store(torrent, actual_save_path, file_entries, [stat for stat in stats if stat is not None], time.time())
+        except Exception as e:
+            self.logger.error(f"Error checking hardlinks for torrent {torrent['name']}: {str(e)}")
+            return False
+
+    def _stat_files(self, paths: List[str], skip_missing: bool = False) -> Optional[List[Optional[Tuple[int, float, int]]]]:
+        """Return (st_ino, st_mtime, st_nlink) per path; None for the whole list if a file vanished."""
+        stats: List[Optional[Tuple[int, float, int]]] = []
+        instrumentation.count('stat_calls', len(paths))
+        for path in paths:
+            try:
+                stat_info = os.stat(path)
+            except FileNotFoundError:
+                if not skip_missing:
+                    return None
+                stats.append(None)
+                continue
+            except OSError as e:
+                self.logger.warning(f"Could not stat file {path}: {str(e)}")
+                stats.append(None)
+                continue
+            stats.append((stat_info.st_ino, stat_info.st_mtime, stat_info.st_nlink))
+        return stats
+
+    def _store(self, torrent: Dict[str, Any], actual_save_path: str, file_entries: List[List[Any]],
+               stats: List[Optional[Tuple[int, float, int]]], now: float) -> bool:
+        # st_nlink > 1 means the file has multiple hardlinks
+        max_links = max((stat[2] for stat in stats if stat is not None), default=1)
+        hardlinked = max_links > 1
+        if hardlinked:
+            self.logger.debug(f"Hardlinked file detected: {torrent['name'][:60]} (links: {max_links})")
+        with self._lock:
+            self._cache[torrent['hash']] = {'save_path': actual_save_path, 'checked': now,
+                                            'hardlinked': hardlinked, 'files': file_entries}
+        return hardlinked
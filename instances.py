@@ -0,0 +1,110 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable, Iterable, MutableMapping, Tuple, TypeVar
+from logging import Logger
+from configparser import ConfigParser
+import requests
+import torrent_utils
+import instrumentation
+from rules import Rules, compile_instances
+from async_client import create_client
+from hardlink_utils import HardlinkChecker
+from torrent_state import get_state_mirror
+
+T = TypeVar('T')
+
+
+class InstanceLogger(logging.LoggerAdapter):
+    """Prefixes every message with the instance name."""
+
+    def process(self, msg: Any, kwargs: MutableMapping[str, Any]) -> Tuple[Any, MutableMapping[str, Any]]:
+        return f"[{self.extra['instance']}] {msg}", kwargs
+
+
+def instance_file_name(file_name: str, name: str) -> str:
+    """hardlink_cache.json -> hardlink_cache.NAME.json; unchanged for the unnamed single instance."""
+    if not name:
+        return file_name
+    root, extension = os.path.splitext(file_name)
+    return f"{root}.{name}{extension}"
+
+
+class Instance:
+    """One qBittorrent instance: its rules, WebUI session, API client and per-instance caches."""
+
+    def __init__(self, name: str, rules: Rules, config: ConfigParser, script_directory: str, logger: Logger):
+        self.name = name
+        self.rules = rules
+        self.logger = InstanceLogger(logger, {'instance': name}) if name else logger
+        self.session = requests.Session()
+        instrumentation.instrument_session(self.session)
+        self.client = create_client(rules.login, rules.api, self.logger, self.session)
+        self.hardlink_checker = HardlinkChecker(self.session, rules.login.address, self.logger, rules,
+                                                os.path.join(script_directory, instance_file_name('hardlink_cache.json', name)),
+                                                self.client)
+        self.state_mirror = get_state_mirror(config, script_directory, instance_file_name('torrent_state.json', name))
+
+    def login(self) -> None:
+        """Log in, raising requests.RequestException or ValueError on failure."""
+        torrent_utils.authenticate(self.session, self.rules.login.address, self.rules.login.username,
+                                   self.rules.login.password)
+
+    def fetch_torrents(self) -> Iterable[Dict[str, Any]]:
+        """
+        Fetch the torrent list, logging in first if the session is not (or no longer) valid.
+        With '[api] stream_torrent_list' the requests client returns an iterator that parses
+        the response while it is consumed; iterate it once.
+        """
+        try:
+            return self._fetch_torrents()
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 403:
+                raise
+            self.login()
+            return self._fetch_torrents()
+
+    def _fetch_torrents(self) -> Iterable[Dict[str, Any]]:
+        api_address = self.rules.login.address
+        if self.state_mirror is not None:
+            return self.state_mirror.sync(self.session, api_address, self.logger)
+        if self.client is not None:
+            return self.client.run(self.client.torrents_info())
+        return torrent_utils.get_torrent_list(self.session, api_address, self.logger,
+                                              self.rules.api.stream_torrent_list)
+
+    def save(self) -> None:
+        self.hardlink_checker.save()
+
+    def close(self) -> None:
+        if self.client is not None:
+            self.client.close()
+        self.session.close()
+
+
+def load_instances(config: ConfigParser, script_directory: str, logger: Logger) -> List[Instance]:
+    """Create an Instance for every [instance:NAME] section, or a single one from [login]."""
+    return [Instance(name, rules, config, script_directory, logger)
+            for name, rules in compile_instances(config, script_directory)]
+
+
+def map_instances(function: Callable[[Instance], T], instances: List[Instance],
+                  strict: bool = False) -> Dict[Instance, T]:
+    """
+    Run function for every instance in parallel and return {instance: result}.
+    An instance that raises is logged and left out, or the error is re-raised when strict.
+    """
+    if not instances:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+        futures = [(instance, executor.submit(function, instance)) for instance in instances]
+    results = {}
+    for instance, future in futures:
+        try:
+            results[instance] = future.result()
+        except Exception as e:
+            if strict:
+                raise
+            instance.logger.error(f"An error occurred: {e}")
+    return results
+
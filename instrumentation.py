@@ -0,0 +1,182 @@
+import bisect
+import cProfile
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Tuple
+from urllib.parse import urlsplit
+import requests
+
+# Constants
+BYTES_TO_MB = 1024**2
+PROFILE_TOP_FUNCTIONS = 30
+PROFILE_FILE_PREFIX = 'cleanup_profile'
+# Summary order; phases not listed here follow alphabetically
+PHASE_ORDER = ('login', 'ratio_history', 'fetch', 'planning', 'hardlinks', 'scoring', 'selection', 'delete', 'ratio_log',
+               'log_flush')
+COUNTERS = ('http_requests', 'http_bytes', 'stat_calls', 'json_loads')
+# Upper bounds in seconds of the API latency histogram buckets (Prometheus 'le')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+API_PATH_PREFIX = '/api/v2/'
+
+
+class RunStats:
+    """
+    Wall time per phase and counters for one run, safe to update from worker threads.
+
+    Phase times are summed over every entry of the phase, so a phase run by several threads
+    at once can add up to more than the run's wall time. Phases may nest (e.g. login during fetch).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        # endpoint -> (requests per LATENCY_BUCKETS bucket plus one for slower ones, total seconds)
+        self.latencies: Dict[str, Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe_latency(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            buckets, total = self.latencies.get(endpoint) or ([0] * (len(LATENCY_BUCKETS) + 1), 0.0)
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latencies[endpoint] = (buckets, total + seconds)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def ordered_phases(self) -> List[str]:
+        return sorted(self.phases, key=lambda name: (PHASE_ORDER.index(name) if name in PHASE_ORDER else len(PHASE_ORDER), name))
+
+    def summary(self) -> str:
+        phases = ', '.join(f"{name} {self.phases[name]:.2f}s" for name in self.ordered_phases())
+        counters = self.counters
+        return (f"Run summary: {self.elapsed():.2f}s total | {phases or 'no phases'} | "
+                f"{counters['http_requests']} HTTP requests, {counters['http_bytes'] / BYTES_TO_MB:.1f} MB, "
+                f"{counters['stat_calls']} stat calls, {counters['json_loads']} JSON loads")
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'total_seconds': round(self.elapsed(), 6),
+            'phases': {name: {'seconds': round(self.phases[name], 6), 'calls': self.calls[name]}
+                       for name in self.ordered_phases()},
+            'counters': dict(self.counters),
+            'api_latency': {endpoint: {'requests': sum(buckets), 'seconds': round(total, 6)}
+                            for endpoint, (buckets, total) in sorted(self.latencies.items())},
+        }
+
+
+_run = RunStats()
+
+
+def start_run() -> RunStats:
+    """Reset the statistics at the start of a run (main.py run or daemon cycle)."""
+    global _run
+    _run = RunStats()
+    return _run
+
+
+def current_run() -> RunStats:
+    return _run
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Add the wall time of the block to phase 'name' of the current run."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _run.add_phase(name, time.perf_counter() - started)
+
+
+def count(name: str, amount: int = 1) -> None:
+    _run.count(name, amount)
+
+
+def instrument_session(session: requests.Session) -> None:
+    """
+    Count the requests of the session and their bytes (request body plus Content-Length of the
+    answer), and record their latency (until the response headers arrived) per API endpoint.
+    """
+
+    def count_hook(response: requests.Response, *args: Any, **kwargs: Any) -> requests.Response:
+        body = response.request.body
+        sent = len(body) if isinstance(body, (bytes, str)) else 0
+        try:
+            received = int(response.headers.get('Content-Length', 0))
+        except ValueError:
+            received = 0
+        _run.count('http_requests')
+        _run.count('http_bytes', sent + received)
+        path = urlsplit(response.url).path
+        endpoint = path.split(API_PATH_PREFIX, 1)[1] if API_PATH_PREFIX in path else path
+        _run.observe_latency(endpoint, response.elapsed.total_seconds())
+        return response
+
+    session.hooks['response'].append(count_hook)
+
+
+@contextmanager
+def profiled(enabled: bool, output_prefix: str) -> Iterator[None]:
+    """
+    With enabled, run the block under cProfile and write <output_prefix>.prof (pstats format,
+    e.g. for snakeviz) and <output_prefix>.json (phases, counters and the slowest functions).
+    Threads started inside the block (instance, hardlink and API workers) get their own profiler
+    and are merged into the same statistics. Include the log flush in the block so it is timed;
+    write errors are printed because the run's log has been written by then.
+    """
+    if not enabled:
+        yield
+        return
+    profilers = [cProfile.Profile()]
+    lock = threading.Lock()
+
+    def profile_thread(frame: Any, event: str, arg: Any) -> None:
+        profiler = cProfile.Profile()
+        with lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    threading.setprofile(profile_thread)
+    profilers[0].enable()
+    try:
+        yield
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None)
+        try:
+            write_profile(profilers, output_prefix)
+        except (OSError, TypeError) as e:
+            print(f"Failed to write profile to {output_prefix}: {e}")
+
+
+def write_profile(profilers: List[cProfile.Profile], output_prefix: str) -> None:
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.dump_stats(f"{output_prefix}.prof")
+
+    top_functions = []
+    for function in sorted(stats.stats, key=lambda key: stats.stats[key][3], reverse=True)[:PROFILE_TOP_FUNCTIONS]:
+        primitive_calls, calls, own_seconds, cumulative_seconds, _ = stats.stats[function]
+        file_name, line, name = function
+        top_functions.append({'function': f"{file_name}:{line}({name})", 'calls': calls,
+                              'own_seconds': round(own_seconds, 6), 'cumulative_seconds': round(cumulative_seconds, 6)})
+    report = _run.report()
+    report['threads_profiled'] = len(profilers)
+    report['top_functions'] = top_functions
+    with open(f"{output_prefix}.json", 'w') as file:
+        json.dump(report, file, indent=2)
@@ -1,9 +1,10 @@
 import logging
 from logging.handlers import RotatingFileHandler
 import os
-from typing import Tuple, List, Dict, Any
-import torrent_utils
+import sys
+from typing import Tuple, List, Dict, Any, Iterator
 import configparser
+import instrumentation
 
 # Constants
 MAX_BYTES = 1 * 1024 * 1024  # 1 MB
@@ -12,16 +13,22 @@ SEPARATOR_LENGTH = 127
 MAX_NAME_LENGTH = 69
 BYTES_TO_GB = 1024 ** 3
 SECONDS_PER_WEEK = 7 * 86400
+READ_BLOCK_SIZE = 64 * 1024
 
-class PrependingRotatingFileHandler(RotatingFileHandler):
+class RunJournalHandler(RotatingFileHandler):
+    """
+    Buffers the log lines of one run and appends them to the log file as a single block.
+
+    Appending costs the same no matter how large the log is; rollover is decided on the size
+    of the block actually being written. Use read_runs_newest_first for a newest-first view.
+    """
     def __init__(self, *args, **kwargs):
-        super(PrependingRotatingFileHandler, self).__init__(*args, **kwargs)
+        kwargs.setdefault('delay', True)
+        super(RunJournalHandler, self).__init__(*args, **kwargs)
         self.log_entries: List[str] = []
         self.first_entry = True
 
     def emit(self, record: logging.LogRecord) -> None:
-        if self.shouldRollover(record):
-            self.doRollover()
         if self.first_entry:
             log_entry = "-" * SEPARATOR_LENGTH + "\n" + self.format(record)
             self.first_entry = False
@@ -30,23 +37,63 @@ class PrependingRotatingFileHandler(RotatingFileHandler):
         self.log_entries.append(log_entry)
 
     def write_log_entries(self) -> None:
+        with instrumentation.phase('log_flush'):
+            self._write_log_entries()
+
+    def _write_log_entries(self) -> None:
         if self.log_entries:
             try:
-                with open(self.baseFilename, 'r+') as file:
-                    existing_content = file.read()
-                    file.seek(0, 0)
-                    file.write('\n'.join(self.log_entries) + '\n' + existing_content)
+                block = '\n'.join(self.log_entries) + '\n'
+                current_size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+                if self.maxBytes > 0 and current_size > 0 and current_size + len(block.encode(self.encoding or 'utf-8')) > self.maxBytes:
+                    self.doRollover()
+                with open(self.baseFilename, 'a', encoding=self.encoding) as file:
+                    file.write(block)
             except IOError as e:
                 print(f"Error writing log entries: {e}")
             finally:
                 self.log_entries = []
                 self.first_entry = True
 
-def setup_logger(log_file_name: str = 'deletelog.txt', config: configparser.ConfigParser = None) -> Tuple[logging.Logger, PrependingRotatingFileHandler]:
+def read_lines_backwards(file_path: str, block_size: int = READ_BLOCK_SIZE) -> Iterator[str]:
+    """Yield the lines of a file from last to first, reading it backwards in blocks."""
+    with open(file_path, 'rb') as file:
+        position = file.seek(0, os.SEEK_END)
+        remainder = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            file.seek(position)
+            lines = (file.read(read_size) + remainder).split(b'\n')
+            # The first piece may be the tail of a line that starts in an earlier block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode('utf-8', errors='replace')
+        if remainder:
+            yield remainder.decode('utf-8', errors='replace')
+
+def read_runs_newest_first(log_file_path: str, backup_count: int = BACKUP_COUNT) -> Iterator[List[str]]:
+    """Yield the logged runs newest first, including rotated files, each run as its lines in order."""
+    separator = "-" * SEPARATOR_LENGTH
+    for log_file in [log_file_path] + [f"{log_file_path}.{i}" for i in range(1, backup_count + 1)]:
+        if not os.path.exists(log_file):
+            continue
+        run: List[str] = []
+        for line in read_lines_backwards(log_file):
+            if not line and not run:
+                continue
+            run.append(line)
+            if line == separator:
+                yield run[::-1]
+                run = []
+        if run:
+            yield run[::-1]
+
+def setup_logger(log_file_name: str = 'deletelog.txt', config: configparser.ConfigParser = None) -> Tuple[logging.Logger, RunJournalHandler]:
     script_directory = os.path.dirname(os.path.abspath(__file__))
     log_file_path = os.path.join(script_directory, log_file_name)
     
-    handler = PrependingRotatingFileHandler(log_file_path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+    handler = RunJournalHandler(log_file_path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
     log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
     handler.setFormatter(log_formatter)
     logger = logging.getLogger()
@@ -62,19 +109,28 @@ def setup_logger(log_file_name: str = 'deletelog.txt', config: configparser.Conf
     logger.setLevel(log_level)
     return logger, handler
 
-def log_torrent_removal_info(torrents_info: List[Dict[str, Any]], logger: logging.Logger, test_mode: bool, bonus_rules: Dict[str, Dict[str, Any]], config: configparser.ConfigParser) -> None:
-    if not torrents_info:
+def log_torrent_removal_info(torrents: List[Dict[str, Any]], logger: logging.Logger, test_mode: bool) -> None:
+    """Log the selected torrents with the 'average_ratio' scores they were ranked by."""
+    if not torrents:
         logger.info("No torrents to remove based on current rules.")
         return
-    logger.info(f"Total torrents to remove: {len(torrents_info)}")
-    log_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'torrent_ratio_log.json')
-    for torrent_info in torrents_info:
+    logger.info(f"Total torrents to remove: {len(torrents)}")
+    for torrent_info in torrents:
         size_gb = torrent_info['size'] / BYTES_TO_GB
         seeding_time_week = torrent_info['seeding_time'] / SECONDS_PER_WEEK
         category = torrent_info.get('category', 'Unknown')
-        average_ratio_per_week = torrent_utils.calculate_average_ratio(torrent_info, log_file_path, logger, bonus_rules, config)
+        average_ratio_per_week = torrent_info['average_ratio']
         truncated_name = (torrent_info['name'][:MAX_NAME_LENGTH - 3] + '...') if len(torrent_info['name']) > MAX_NAME_LENGTH else torrent_info['name']
         size_str = f"{size_gb:.2f} GB".rjust(10)
         seeding_time_str = f"{seeding_time_week:.1f} Weeks".rjust(11)
         ratio_week_str = f"{average_ratio_per_week:.3f} R/W".rjust(11)
-        logger.info(f"{truncated_name:<69}  \t{category} \t{size_str} \t{seeding_time_str} \t{ratio_week_str}")
\ No newline at end of file
+        logger.info(f"{truncated_name:<69}  \t{category} \t{size_str} \t{seeding_time_str} \t{ratio_week_str}")
+
+if __name__ == "__main__":
+    # Print the delete log newest run first: python logger_utils.py [number of runs]
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    max_runs = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    for run_number, run_lines in enumerate(read_runs_newest_first(os.path.join(script_directory, 'deletelog.txt'))):
+        if max_runs is not None and run_number >= max_runs:
+            break
+        print('\n'.join(run_lines))
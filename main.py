@@ -1,118 +1,141 @@
 import sys
 import os
 import platform
-import requests
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
 from logging import Logger
 import logger_utils
 import torrent_utils
+import daemon
+import pipeline
+import instrumentation
+import deletion
+from ratio_history import RatioHistory, load_ratio_history
+from instances import Instance, load_instances, map_instances
+from space_planner import SpacePlanner
+from forecast import FORECAST_FILE, SpaceForecaster
+from metrics import MetricsExporter, cleanup_metrics
 from configparser import ConfigParser
 
-def check_space_and_remove_torrents(session: requests.Session, logger: Logger, config: ConfigParser, test_mode: bool, bonus_rules: Dict[str, Dict[str, Any]]) -> None:
-    api_address = config.get('login', 'address')
-    download_minspace_gb = config.get('cleanup', 'download_minspace_gb', fallback='')
-    min_space_gb = config.getfloat('cleanup', 'min_space_gb')
-    categories_space = [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_check_for_space').split(',')]
-    categories_count = [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_check_for_number').split(',')]
-    
-    script_directory = os.path.dirname(os.path.abspath(__file__))
-    configured_drive_path = config.get('cleanup', 'drive_path', fallback='').strip()
-    drive_path = configured_drive_path if configured_drive_path else script_directory
-    
-    free_space = torrent_utils.get_free_space(drive_path)
-    
-    try:
-        all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 403:
-            torrent_utils.login_to_qbittorrent(session, api_address,
-                                               config.get('login', 'username'),
-                                               config.get('login', 'password'), logger)
-            all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
-        else:
-            raise
-    
-    downloading_torrents = [t for t in all_torrents if t['state'] == 'downloading']
-    total_remaining_size_gb = sum((t['size'] * (1 - t['progress'])) for t in downloading_torrents) / (1024**3)
-    space_left_after_downloads = free_space - total_remaining_size_gb
-    
-    # Check if download_minspace_gb is set and not empty
-    if download_minspace_gb and download_minspace_gb.strip():
-        download_minspace_gb = float(download_minspace_gb)
-        additional_space_needed = max(0, download_minspace_gb - space_left_after_downloads)
-    else:
-        additional_space_needed = 0
-    
-    space_needed = max(0, min_space_gb - free_space)
-    
-    category_rules = torrent_utils.get_category_rules(config)
-    filtered_torrents = torrent_utils.filter_torrents_by_rules(
-        all_torrents,
-        category_rules,
-        logger
-    )
-    
-    # Only process if there's work to be done
-    if space_needed > 0 or additional_space_needed > 0:
-        torrents_removed_by_space = torrent_utils.remove_torrents_by_space(
-            filtered_torrents,
-            categories_space,
-            max(additional_space_needed, space_needed),
-            drive_path,
-            logger,
-            session,
-            api_address,
-            test_mode,
-            os.path.join(script_directory, 'torrent_ratio_log.json'),
-            bonus_rules,
-            config
-        )
-    else:
-        torrents_removed_by_space = []
-    
-    torrents_removed_by_count = torrent_utils.remove_torrents_by_count(
-        filtered_torrents,
-        categories_count,
-        config.getint('cleanup', 'max_torrents_for_categories'),
-        logger,
-        session,
-        api_address,
-        test_mode,
-        os.path.join(script_directory, 'torrent_ratio_log.json'),
-        bonus_rules,
-        config.getboolean('cleanup', 'sort_count_removal_by_size', fallback=False),
-        config
-    )
-    
-    all_removed_torrents = torrents_removed_by_space + torrents_removed_by_count
+def check_space_and_remove_torrents(instances: List[Instance], logger: Logger, test_mode: bool,
+                                    ratio_history: RatioHistory, stop_event: Optional[threading.Event] = None,
+                                    state_directory: str = '') -> pipeline.CleanupResult:
+    """
+    Run the cleanup pipeline: fetch and rule-filter every instance in parallel, resolve each
+    disk's deficit once from the torrents stored on that disk (ranked together across all
+    instances), then apply the count limits to what is left, delete and report.
+    Hardlink verdicts and scores are computed at most once per torrent (see pipeline.Candidates).
+    With paced deletion the deletions go through the queue in pending_deletes.json; deletions an
+    interrupted run left there are finished first. The queue is locked for the whole run, and a
+    run that overlaps one still releasing deletions leaves the queue alone and deletes nothing
+    paced. With [forecast] enabled every run adds a sample to space_forecast.json and frees
+    space ahead of time. Both files live in state_directory (default: next to this script).
+    """
+    state_directory = state_directory or os.path.dirname(os.path.abspath(__file__))
+    pending_deletes_path = os.path.join(state_directory, deletion.PENDING_DELETES_FILE)
+    # Overlapping runs must not release the same queued deletions twice
+    with deletion.queue_lock(pending_deletes_path, enabled=not test_mode) as owns_queue:
+        if owns_queue:
+            deletion.resume_pending(instances, pending_deletes_path, logger, stop_event)
+        elif not test_mode:
+            logger.warning(f"{pending_deletes_path} is locked by another run; not resuming or queueing paced deletions")
+        candidates = pipeline.build_candidates(instances, ratio_history)
+        active_instances = [instance for instance in instances if instance in candidates]
+        with instrumentation.phase('planning'):
+            disks = SpacePlanner(logger).plan(active_instances,
+                                              {instance: candidates[instance].downloading for instance in active_instances},
+                                              {instance: candidates[instance].eligible for instance in active_instances})
+            # [forecast] is shared by all instances
+            if active_instances and active_instances[0].rules.forecast.enabled:
+                forecaster = SpaceForecaster(os.path.join(state_directory, FORECAST_FILE),
+                                             active_instances[0].rules.forecast, logger)
+                forecaster.apply(disks, record=not test_mode)
+                if not test_mode:
+                    forecaster.save()
+        disk_removals = [pipeline.plan_space_removals(disk, candidates, logger) for disk in disks]
+        removed_by_count = map_instances(lambda instance: pipeline.plan_count_removals(candidates[instance]),
+                                         active_instances)
+
+        # Delete all selected torrents in as few requests as possible, or release them paced ([cleanup] is shared)
+        pacing = instances[0].rules.delete_pacing if instances else None
+        paced = pacing is not None and pacing.enabled
+        if owns_queue and paced:
+            queue = deletion.DeletionQueue.load(pending_deletes_path, logger)
+            queue.add(pipeline.pending_deletes(candidates, disks))
+            deleted = {(entry.instance, entry.hash) for entry in deletion.run_deletions(queue, instances, pacing, logger,
+                                                                                        stop_event)}
+            # Kept, failed and still queued torrents are not reported as removed
+            for instance in active_instances:
+                candidates[instance].deselect([torrent_hash for torrent_hash in candidates[instance].selected
+                                               if (instance.name, torrent_hash) not in deleted])
+        elif not test_mode and paced:
+            # The other run releases its own selection; nothing was deleted here
+            for instance in active_instances:
+                candidates[instance].deselect(list(candidates[instance].selected))
+        elif not test_mode:
+            map_instances(lambda instance: pipeline.delete_selected(candidates[instance]),
+                          [instance for instance in active_instances if candidates[instance].selected])
     
-    # Only log if something was actually removed
-    if all_removed_torrents:
-        log_removal_info(logger, free_space, total_remaining_size_gb, space_needed, additional_space_needed, all_removed_torrents, test_mode, bonus_rules, config)
-        
+    # Only log if something was actually removed. Count removals are listed with the instance's drive_path disk.
+    for disk, removed_from_disk in zip(disks, disk_removals):
+        for instance in disk.instances:
+            removed_from_disk[instance] = removed_from_disk.get(instance, []) + removed_by_count.get(instance, [])
+        removed_from_disk = {instance: [torrent for torrent in torrents if candidates[instance].is_selected(torrent)]
+                             for instance, torrents in removed_from_disk.items()}
+        if any(removed_from_disk.values()):
+            for instance, torrents in removed_from_disk.items():
+                candidates[instance].score(torrents)
+            space_needed, additional_space_needed = disk.space_needed()
+            log_removal_info(logger, disk.free_space, disk.remaining_download_gb, space_needed, additional_space_needed,
+                             removed_from_disk, test_mode, disk.mount_point if len(disks) > 1 else '')
+    return pipeline.CleanupResult(instances, candidates, disks)
+
 def log_removal_info(logger: Logger, free_space: float, total_remaining_size_gb: float, 
                      space_needed: float, additional_space_needed: float, 
-                     all_removed_torrents: List[Dict[str, Any]], test_mode: bool,
-                     bonus_rules: Dict[str, Dict[str, Any]], config: ConfigParser) -> None:
-    """Log information about removed or would-be removed torrents."""
-    logger.info(f"{'TEST MODE: ' if test_mode else ''}Free: {free_space:.2f} GB, "
+                     removed_torrents: Dict[Instance, List[Dict[str, Any]]], test_mode: bool,
+                     mount_point: str = '') -> None:
+    """Log information about removed or would-be removed torrents of the instances sharing a disk."""
+    logger.info(f"{'TEST MODE: ' if test_mode else ''}{f'{mount_point}: ' if mount_point else ''}Free: {free_space:.2f} GB, "
                 f"DLremain: {total_remaining_size_gb:.1f} GB, "
                 f"Diskneed: {max(space_needed, additional_space_needed):.0f} GB")
-    logger_utils.log_torrent_removal_info(all_removed_torrents, logger, test_mode, bonus_rules, config)
+    for instance, torrents in removed_torrents.items():
+        if torrents:
+            logger_utils.log_torrent_removal_info(torrents, instance.logger, test_mode)
 
-def main(test_mode: bool, logger: Logger, handler: Any, config: ConfigParser, session: requests.Session) -> None:
-    try:
-        bonus_rules = torrent_utils.load_bonus_rules(config)
-        check_space_and_remove_torrents(session, logger, config, test_mode, bonus_rules)
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-    finally:
-        handler.write_log_entries()
+def main(test_mode: bool, logger: Logger, handler: Any, config: ConfigParser, profile: bool = False) -> None:
+    instances: List[Instance] = []
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    profile_prefix = os.path.join(script_directory, instrumentation.PROFILE_FILE_PREFIX)
+    exporter = MetricsExporter(config, logger)
+    result = None
+    stats = instrumentation.start_run()
+    with instrumentation.profiled(profile, profile_prefix):
+        try:
+            instances = load_instances(config, script_directory, logger)
+            ratio_history = load_ratio_history(config, script_directory)
+            result = check_space_and_remove_torrents(instances, logger, test_mode, ratio_history)
+            for instance in instances:
+                instance.save()
+        except Exception as e:
+            logger.error(f"An error occurred: {e}")
+            result = None
+        finally:
+            exporter.publish('cleanup', cleanup_metrics(stats, result, test_mode))
+            for instance in instances:
+                instance.close()
+            logger.info(stats.summary())
+            if profile:
+                logger.info(f"Profile: {profile_prefix}.prof, {profile_prefix}.json")
+            handler.write_log_entries()
 
 if __name__ == "__main__":
     script_directory = os.path.dirname(os.path.abspath(__file__))
     config = torrent_utils.load_configuration(script_directory)
     logger, log_handler = logger_utils.setup_logger(config=config)
-    session = requests.Session()
     test_mode = '--test' in sys.argv
-    main(test_mode, logger, log_handler, config, session)
\ No newline at end of file
+    profile = '--profile' in sys.argv
+    if '--daemon' in sys.argv:
+        daemon.run_daemon(config, logger, log_handler, test_mode, script_directory, check_space_and_remove_torrents,
+                          profile)
+    else:
+        main(test_mode, logger, log_handler, config, profile)
\ No newline at end of file
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Any, Optional, Tuple
+from logging import Logger
+from configparser import ConfigParser
+import torrent_utils
+from instrumentation import RunStats, LATENCY_BUCKETS
+from pipeline import CleanupResult
+from ratio_history import RatioHistory
+
+# Constants
+METRIC_PREFIX = 'qbt_autodelete'
+TEXTFILE_NAMES = {'cleanup': 'qbt_autodelete_cleanup.prom', 'ratio_log': 'qbt_autodelete_ratio_log.prom'}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_HTTP_ADDRESS = '127.0.0.1'
+BYTES_PER_GB = 1024**3
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricFamilies:
+    """Samples grouped by metric name, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        # name -> (type, help, [(labels, value)])
+        self._families: Dict[str, Tuple[str, str, List[Tuple[Dict[str, str], float]]]] = {}
+
+    def add(self, name: str, kind: str, help_text: str, value: float, **labels: str) -> None:
+        family = self._families.setdefault(f"{METRIC_PREFIX}_{name}", (kind, help_text, []))
+        family[2].append((labels, value))
+
+    def gauge(self, name: str, help_text: str, value: float, **labels: str) -> None:
+        self.add(name, 'gauge', help_text, value, **labels)
+
+    def histogram(self, name: str, help_text: str, buckets: List[int], total: float, **labels: str) -> None:
+        """buckets: observations per LATENCY_BUCKETS bucket plus one for slower ones (not cumulative)."""
+        cumulative = 0
+        for upper_bound, observations in zip(LATENCY_BUCKETS + (float('inf'),), buckets):
+            cumulative += observations
+            self.add(name, 'histogram', help_text, cumulative, **labels, le=_format_value(upper_bound))
+        family = self._families[f"{METRIC_PREFIX}_{name}"]
+        family[2].append(({**labels, '__suffix__': '_sum'}, total))
+        family[2].append(({**labels, '__suffix__': '_count'}, cumulative))
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, samples) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                labels = dict(labels)
+                suffix = labels.pop('__suffix__', '_bucket' if kind == 'histogram' else '')
+                label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                lines.append(f"{name}{suffix}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f"{name}{suffix} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def add_run_metrics(families: MetricFamilies, job: str, stats: RunStats, success: bool) -> None:
+    """Duration, phases, I/O counters and API latency of a run (job 'cleanup' or 'ratio_log')."""
+    families.gauge(f"{job}_last_run_timestamp_seconds", "Unix time the last run finished.", round(time.time(), 3))
+    families.gauge(f"{job}_success", "1 if the last run completed without an error.", int(success))
+    families.gauge(f"{job}_duration_seconds", "Wall time of the last run.", round(stats.elapsed(), 6))
+    for phase in stats.ordered_phases():
+        families.gauge(f"{job}_phase_seconds", "Time spent per phase in the last run, summed over threads.",
+                       round(stats.phases[phase], 6), phase=phase)
+    families.gauge(f"{job}_http_requests", "WebUI API requests sent in the last run.", stats.counters['http_requests'])
+    families.gauge(f"{job}_http_bytes", "Request and response bytes of the WebUI API in the last run.",
+                   stats.counters['http_bytes'])
+    families.gauge(f"{job}_stat_calls", "Filesystem stat calls in the last run.", stats.counters['stat_calls'])
+    families.gauge(f"{job}_json_loads", "JSON documents decoded in the last run.", stats.counters['json_loads'])
+    for endpoint, (buckets, total) in sorted(stats.latencies.items()):
+        families.histogram(f"{job}_api_request_duration_seconds",
+                           "WebUI API latency until the response headers arrived, in the last run.",
+                           buckets, round(total, 6), endpoint=endpoint)
+
+
+def cleanup_metrics(stats: RunStats, result: Optional[CleanupResult], test_mode: bool) -> MetricFamilies:
+    """Metrics of a main.py cleanup run; result is None when the run failed before it completed."""
+    families = MetricFamilies()
+    add_run_metrics(families, 'cleanup', stats, result is not None)
+    families.gauge('cleanup_test_mode', "1 if the last run was a --test run that deleted nothing.", int(test_mode))
+    if result is None:
+        return families
+
+    for instance in result.instances:
+        name = instance.name or 'default'
+        candidates = result.candidates.get(instance)
+        families.gauge('cleanup_instance_up', "1 if the torrent list of the instance could be fetched.",
+                       int(candidates is not None), instance=name)
+        if candidates is None:
+            continue
+        families.gauge('cleanup_torrents_evaluated', "Torrents fetched and evaluated against the seed rules.",
+                       candidates.evaluated, instance=name)
+        families.gauge('cleanup_torrents_eligible', "Torrents meeting their category's seed rules.",
+                       len(candidates.eligible), instance=name)
+        families.gauge('cleanup_hardlink_skips', "Removal candidates skipped because they are hardlinked.",
+                       len(candidates.hardlink_skips), instance=name)
+        for reason in ('space', 'count'):
+            selected = [candidates.selected[torrent_hash]
+                        for torrent_hash, selected_for in candidates.selection_reasons.items() if selected_for == reason]
+            # Not yet deleted torrents (failed, kept or still queued by paced deletion) were deselected by the cleanup
+            families.gauge('cleanup_torrents_removed', "Torrents deleted in the last run (or, in test mode, that would be).",
+                           len(selected), instance=name, reason=reason)
+            families.gauge('cleanup_bytes_freed', "Reported size of the torrents deleted in the last run "
+                           "(or, in test mode, that would be); qBittorrent may still be deleting the files.",
+                           sum(torrent['size'] for torrent in selected), instance=name, reason=reason)
+
+    for disk in result.disks:
+        space_needed, additional_space_needed = disk.space_needed()
+        try:
+            free_after = torrent_utils.get_free_space(disk.mount_point)
+        except OSError:
+            free_after = disk.free_space
+        free_help = "Free space of the disk before the cleanup and right after it; qBittorrent may still be deleting files."
+        families.gauge('disk_free_bytes', free_help, int(disk.free_space * BYTES_PER_GB), mount=disk.mount_point, when='before')
+        families.gauge('disk_free_bytes', free_help, int(free_after * BYTES_PER_GB), mount=disk.mount_point, when='after')
+        families.gauge('disk_needed_bytes', "Space the cleanup had to free on the disk to meet its targets.",
+                       int(max(space_needed, additional_space_needed) * BYTES_PER_GB), mount=disk.mount_point)
+        families.gauge('disk_downloads_remaining_bytes', "Bytes still to be downloaded to the disk.",
+                       int(disk.remaining_download_gb * BYTES_PER_GB), mount=disk.mount_point)
+    return families
+
+
+def ratio_log_metrics(stats: RunStats, history: Optional[RatioHistory], log_file_path: str,
+                      torrents_recorded: int) -> MetricFamilies:
+    """Metrics of a ratio snapshot; history is None when the snapshot failed."""
+    families = MetricFamilies()
+    add_run_metrics(families, 'ratio_log', stats, history is not None)
+    if history is None:
+        return families
+    families.gauge('ratio_log_torrents_recorded', "Torrents whose ratio was recorded in the last snapshot.",
+                   torrents_recorded)
+    families.gauge('ratio_log_torrents', "Torrents with a ratio history in the ratio log.", len(history))
+    try:
+        families.gauge('ratio_log_size_bytes', "Size of the ratio log file.", os.path.getsize(log_file_path))
+    except OSError:
+        pass
+    return families
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """http.server.ThreadingHTTPServer, which needs Python 3.7."""
+    daemon_threads = True
+
+
+class MetricsExporter:
+    """
+    Publishes the metrics of the last run of each job ('cleanup', 'ratio_log') as configured
+    in the [metrics] section: to a node-exporter textfile collector directory and, when started
+    by the daemon, on an HTTP /metrics endpoint.
+    """
+
+    def __init__(self, config: ConfigParser, logger: Logger):
+        self.logger = logger
+        self.textfile_directory = config.get('metrics', 'textfile_directory', fallback='').strip()
+        self.http_port = config.getint('metrics', 'http_port', fallback=0)
+        self.http_address = config.get('metrics', 'http_address', fallback=DEFAULT_HTTP_ADDRESS).strip() or DEFAULT_HTTP_ADDRESS
+        self._texts: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._server: Optional['MetricsServer'] = None
+
+    def publish(self, job: str, families: MetricFamilies) -> None:
+        text = families.render()
+        with self._lock:
+            self._texts[job] = text
+        if self.textfile_directory:
+            self._write_textfile(os.path.join(self.textfile_directory, TEXTFILE_NAMES[job]), text)
+
+    def _write_textfile(self, path: str, text: str) -> None:
+        # node-exporter may read at any time, so replace the file atomically
+        temp_path = path + '.tmp'
+        try:
+            with open(temp_path, 'w') as file:
+                file.write(text)
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.logger.error(f"Error writing metrics to {path}: {e}")
+
+    def render(self) -> str:
+        with self._lock:
+            return ''.join(self._texts.values())
+
+    def start_http(self) -> None:
+        """Serve /metrics in a background thread if http_port is set."""
+        if self.http_port <= 0:
+            return
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        try:
+            self._server = MetricsServer((self.http_address, self.http_port), MetricsHandler)
+        except OSError as e:
+            self.logger.error(f"Could not serve metrics on {self.http_address}:{self.http_port}: {e}")
+            return
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        self.logger.info(f"Serving metrics on http://{self.http_address}:{self.http_port}/metrics")
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,235 @@
+import heapq
+from typing import Dict, List, Any, Iterable, Iterator, NamedTuple, Set
+from logging import Logger
+import torrent_utils
+import instrumentation
+import scoring
+from ratio_history import RatioHistory
+from instances import Instance, map_instances
+from space_planner import Disk
+from deletion import PendingDelete, delete_torrents
+from selection import select_for_space
+
+
+class Candidates:
+    """
+    The torrents of one instance for a single cleanup run, annotated once per torrent.
+
+    The rule filter runs when the candidates are built, in a single pass over the fetched
+    torrents (which may be a stream); only the eligible torrents and the running downloads,
+    needed for the space plan, are kept. Hardlink verdicts (memoized by the instance's
+    HardlinkChecker until its next reset) and scores ('average_ratio') are computed on first
+    use only, so the space planner, the count planner and the report share them.
+    Torrents chosen by a planning stage are recorded in 'selected' and skipped by later stages.
+    The counts kept along the way (evaluated, hardlink_skips, selection reasons) feed the metrics.
+    """
+
+    def __init__(self, instance: Instance, torrents: Iterable[Dict[str, Any]], ratio_history: RatioHistory):
+        self.instance = instance
+        self.rules = instance.rules
+        self.logger = instance.logger
+        self.ratio_history = ratio_history
+        self.downloading: List[Dict[str, Any]] = []
+        self.evaluated = 0
+        self.eligible = torrent_utils.filter_torrents_by_rules(self._collect_downloading(torrents),
+                                                               self.rules.seed_rules, self.logger)
+        self._scored: Set[str] = set()
+        # Hashes of candidates skipped because they are hardlinked
+        self.hardlink_skips: Set[str] = set()
+        # hash -> torrent, in selection order, and hash -> planning stage ('space' or 'count')
+        self.selected: Dict[str, Dict[str, Any]] = {}
+        self.selection_reasons: Dict[str, str] = {}
+
+    def _collect_downloading(self, torrents: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for torrent in torrents:
+            self.evaluated += 1
+            if torrent['state'] == 'downloading':
+                self.downloading.append(torrent)
+            yield torrent
+
+    def hardlinked(self, torrents: List[Dict[str, Any]]) -> Dict[str, bool]:
+        """Return {hash: hardlinked}; each torrent is checked at most once per run."""
+        hardlinked = self.instance.hardlink_checker.check_many(torrents)
+        self.hardlink_skips.update(torrent_hash for torrent_hash, linked in hardlinked.items() if linked)
+        return hardlinked
+
+    def score(self, torrents: Iterable[Dict[str, Any]]) -> None:
+        """Set 'average_ratio' on the torrents that were not scored yet, in one batched pass."""
+        missing = [torrent for torrent in torrents if torrent['hash'] not in self._scored]
+        if not missing:
+            return
+        scores = scoring.score_torrents(missing, self.ratio_history, self.logger, self.rules)
+        for torrent, score in zip(missing, scores):
+            torrent['average_ratio'] = score
+            self._scored.add(torrent['hash'])
+
+    def is_selected(self, torrent: Dict[str, Any]) -> bool:
+        return torrent['hash'] in self.selected
+
+    def select(self, torrents: Iterable[Dict[str, Any]], reason: str) -> None:
+        for torrent in torrents:
+            self.selected[torrent['hash']] = torrent
+            self.selection_reasons[torrent['hash']] = reason
+
+    def deselect(self, torrent_hashes: Iterable[str]) -> None:
+        """Forget selected torrents that were not deleted after all (failed, or kept or still queued by paced deletion)."""
+        for torrent_hash in torrent_hashes:
+            self.selected.pop(torrent_hash, None)
+            self.selection_reasons.pop(torrent_hash, None)
+
+
+class CleanupResult(NamedTuple):
+    """What a cleanup run evaluated and selected, for reporting and metrics."""
+    instances: List[Instance]
+    candidates: Dict[Instance, Candidates]
+    disks: List[Disk]
+
+
+def build_candidates(instances: List[Instance], ratio_history: RatioHistory) -> Dict[Instance, Candidates]:
+    """Fetch and rule-filter every instance in parallel. Instances that fail are logged and left out."""
+    def fetch(instance: Instance) -> Candidates:
+        with instrumentation.phase('fetch'):
+            return Candidates(instance, instance.fetch_torrents(), ratio_history)
+
+    return map_instances(fetch, instances)
+
+
+def rank_space_candidates(candidates: Candidates, torrents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return the torrents that may be removed for space, in removal order (see removal_sort_key)."""
+    rules = candidates.rules
+    logger = candidates.logger
+    torrents_in_categories = [t for t in torrents
+                              if t['category'].lower() in rules.categories_space and not candidates.is_selected(t)]
+
+    if not torrents_in_categories:
+        return []
+
+    # Filter out torrents with hardlinked files
+    hardlinked = candidates.hardlinked(torrents_in_categories)
+    torrents_without_hardlinks = [t for t in torrents_in_categories if not hardlinked[t['hash']]]
+    hardlinked_count = len(torrents_in_categories) - len(torrents_without_hardlinks)
+
+    # Only log if we have torrents available for removal
+    if torrents_without_hardlinks:
+        if hardlinked_count > 0:
+            logger.info(f"Space check: {len(torrents_without_hardlinks)} torrents available ({hardlinked_count} skipped due to hardlinks)")
+        else:
+            logger.info(f"Space check: {len(torrents_without_hardlinks)} torrents available for removal")
+    else:
+        # All torrents are hardlinked, no logging needed
+        return []
+
+    candidates.score(torrents_without_hardlinks)
+    return sorted(torrents_without_hardlinks, key=torrent_utils.removal_sort_key)
+
+
+def plan_space_removals(disk: Disk, candidates: Dict[Instance, Candidates],
+                        logger: Logger) -> Dict[Instance, List[Dict[str, Any]]]:
+    """
+    Resolve the deficit of one disk from the torrents stored on it, ranked together across all
+    instances. The chosen torrents are marked selected and returned per instance.
+    """
+    space_needed, additional_space_needed = disk.space_needed()
+    if space_needed <= 0 and additional_space_needed <= 0:
+        return {}
+    ranked = map_instances(lambda instance: rank_space_candidates(candidates[instance], disk.candidates[instance]),
+                           [instance for instance in disk.candidates if instance in candidates])
+    if not ranked:
+        return {}
+    with instrumentation.phase('selection'):
+        selected = select_for_space(
+            list(heapq.merge(*ranked.values(), key=torrent_utils.removal_sort_key)),
+            # The [cleanup] selection settings are shared by all instances
+            max(additional_space_needed, space_needed), next(iter(ranked)).rules, logger)
+    selected_ids = {id(torrent) for torrent in selected}
+    removed: Dict[Instance, List[Dict[str, Any]]] = {}
+    for instance, ranked_torrents in ranked.items():
+        removed[instance] = [torrent for torrent in ranked_torrents if id(torrent) in selected_ids]
+        candidates[instance].select(removed[instance], 'space')
+    return removed
+
+
+def plan_count_removals(candidates: Candidates) -> List[Dict[str, Any]]:
+    """
+    Select torrents to remove to maintain a maximum count per category.
+
+    Torrents already selected for space count as removed: they lower the category's count and
+    are never selected again. Candidates are popped from a heap in removal order and only those
+    are checked for hardlinks, in batches of the number still missing, so a large category that
+    is a few torrents over its limit needs a few hardlink checks instead of one per torrent.
+    """
+    rules = candidates.rules
+    logger = candidates.logger
+    torrents_removed = []
+    max_torrents = rules.max_torrents_for_categories
+    index = torrent_utils.index_by_category(candidates.eligible, rules.categories_count)
+
+    for category in rules.categories_count:
+        remaining = [torrent for torrent in index[category] if not candidates.is_selected(torrent)]
+
+        if len(remaining) > max_torrents:
+            logger.info(f"Category '{category}' has {len(remaining)} torrents, exceeding limit of {max_torrents}")
+
+            if rules.sort_count_removal_by_size:
+                heap = [((-torrent['size'],), position) for position, torrent in enumerate(remaining)]
+            else:
+                # Ranking needs every score; scoring is one batched pass, the hardlink checks below are lazy
+                candidates.score(remaining)
+                heap = [(torrent_utils.removal_sort_key(torrent), position) for position, torrent in enumerate(remaining)]
+            heapq.heapify(heap)
+
+            # Hardlinked torrents still count towards the limit but are skipped
+            num_to_remove = len(remaining) - max_torrents
+            torrents_to_remove = []
+            hardlinked_count = 0
+            while heap and len(torrents_to_remove) < num_to_remove:
+                batch = [remaining[heapq.heappop(heap)[1]]
+                         for _ in range(min(num_to_remove - len(torrents_to_remove), len(heap)))]
+                hardlinked = candidates.hardlinked(batch)
+                for torrent in batch:
+                    if hardlinked[torrent['hash']]:
+                        hardlinked_count += 1
+                    else:
+                        torrents_to_remove.append(torrent)
+
+            if hardlinked_count > 0:
+                logger.info(f"Category '{category}': Skipped {hardlinked_count} hardlinked torrents")
+
+            logger.info(f"Category '{category}': Removing {len(torrents_to_remove)} torrents")
+
+            candidates.select(torrents_to_remove, 'count')
+            torrents_removed.extend(torrents_to_remove)
+        else:
+            logger.debug(f"Category '{category}': {len(remaining)} torrents (within limit of {max_torrents})")
+
+    return torrents_removed
+
+
+def delete_selected(candidates: Candidates) -> None:
+    """Delete every selected torrent of the instance in as few requests as possible; failed ones are deselected."""
+    with instrumentation.phase('delete'):
+        candidates.deselect(delete_torrents(candidates.instance, list(candidates.selected)))
+
+
+def pending_deletes(candidates: Dict[Instance, Candidates], disks: List[Disk]) -> List[PendingDelete]:
+    """
+    The selected torrents of every instance as entries of the paced deletion queue. Space removals
+    carry the mount point of their disk and the free space that resolves the disk's deficit.
+    """
+    targets: Dict[int, Disk] = {}
+    for disk in disks:
+        for torrents in disk.candidates.values():
+            targets.update((id(torrent), disk) for torrent in torrents)
+    entries = []
+    for instance, instance_candidates in candidates.items():
+        for torrent_hash, torrent in instance_candidates.selected.items():
+            reason = instance_candidates.selection_reasons[torrent_hash]
+            disk = targets.get(id(torrent)) if reason == 'space' else None
+            if disk is None:
+                entries.append(PendingDelete(instance.name, torrent_hash, torrent['name'], torrent['size'], reason))
+                continue
+            space_needed, additional_space_needed = disk.space_needed()
+            entries.append(PendingDelete(instance.name, torrent_hash, torrent['name'], torrent['size'], reason,
+                                         disk.mount_point,
+                                         disk.free_space + max(space_needed, additional_space_needed)))
+    return entries
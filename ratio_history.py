@@ -0,0 +1,388 @@
+import json
+import os
+import sqlite3
+import sys
+from array import array
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import configparser
+import instrumentation
+
+# Constants
+RATIO_LOG_BACKENDS = ('json', 'sqlite', 'ring')
+JSON_LOG_FILE = 'torrent_ratio_log.json'
+SQLITE_LOG_FILE = 'torrent_ratio_log.db'
+RING_LOG_FILE = 'torrent_ratio_log.ring'
+RING_FORMAT_VERSION = 1
+SECONDS_PER_DAY = 24 * 3600
+
+
+def load_ratio_log(log_file_path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Load ratio log from file."""
+    try:
+        with open(log_file_path, 'r') as file:
+            instrumentation.count('json_loads')
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON from {log_file_path}: {str(e)}")
+        return {}
+
+
+class RatioHistory:
+    """
+    Ratio history of all torrents, loaded once per run and shared by every scoring call.
+
+    Scoring only needs the oldest retained ratio and the number of records for a hash,
+    so only those are kept, indexed per hash.
+    """
+
+    def __init__(self, summaries: Optional[Dict[str, Tuple[Optional[float], int]]] = None):
+        self._summaries = summaries if summaries is not None else {}
+
+    @classmethod
+    def from_ratio_log(cls, ratio_log: Dict[str, List[Dict[str, Any]]]) -> 'RatioHistory':
+        """Build the history from the {hash: [{'date', 'ratio'}, ...]} ratio log structure."""
+        return cls({torrent_hash: (records[0]['ratio'] if records else None, len(records))
+                    for torrent_hash, records in ratio_log.items()})
+
+    @classmethod
+    def load(cls, log_file_path: str) -> 'RatioHistory':
+        """Load the ratio history from the JSON ratio log."""
+        return cls.from_ratio_log(load_ratio_log(log_file_path))
+
+    def summary(self, torrent_hash: str) -> Tuple[Optional[float], int]:
+        """Return (oldest ratio or None, number of records) for a torrent."""
+        return self._summaries.get(torrent_hash, (None, 0))
+
+    def __contains__(self, torrent_hash: str) -> bool:
+        return torrent_hash in self._summaries
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+
+class SqliteRatioStore:
+    """
+    Ratio history in SQLite (WAL mode), one row per torrent and day.
+
+    A daily snapshot is a single transaction of set-based statements instead of rewriting
+    the whole JSON file, with the same trimming as torrent_ratio_logger.process_torrent_data.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # The primary key doubles as the (hash, date) index
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS ratio_log (
+                hash TEXT NOT NULL,
+                date TEXT NOT NULL,
+                ratio REAL NOT NULL,
+                PRIMARY KEY (hash, date)
+            ) WITHOUT ROWID
+        """)
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def load_history(self) -> RatioHistory:
+        """Load the oldest ratio and record count of every torrent."""
+        rows = self.connection.execute("""
+            SELECT r.hash, r.ratio, c.records
+            FROM (SELECT hash, MIN(date) AS oldest, COUNT(*) AS records FROM ratio_log GROUP BY hash) AS c
+            JOIN ratio_log AS r ON r.hash = c.hash AND r.date = c.oldest
+        """)
+        return RatioHistory({torrent_hash: (ratio, records) for torrent_hash, ratio, records in rows})
+
+    def record_snapshot(self, torrents: List[Dict[str, Any]], current_date: str, max_entries: int,
+                        purge_days: List[int]) -> Tuple[int, int, int, int]:
+        """
+        Add today's ratio of every torrent in one transaction.
+        Returns (torrents in log, new torrents added, torrents removed, torrents with max entries).
+        """
+        with self.connection:
+            cursor = self.connection.cursor()
+            cursor.execute("DROP TABLE IF EXISTS temp.snapshot")
+            cursor.execute("CREATE TEMP TABLE snapshot (hash TEXT PRIMARY KEY, ratio REAL NOT NULL, seed_days INTEGER NOT NULL)")
+            cursor.executemany("INSERT OR REPLACE INTO snapshot (hash, ratio, seed_days) VALUES (?, ?, ?)",
+                               ((t['hash'], t['ratio'], t['seeding_time'] // SECONDS_PER_DAY) for t in torrents))
+
+            total_torrents = cursor.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0]
+            new_torrents_added = cursor.execute("""
+                SELECT COUNT(*) FROM snapshot AS s
+                WHERE NOT EXISTS (SELECT 1 FROM ratio_log AS r WHERE r.hash = s.hash)
+            """).fetchone()[0]
+            torrents_removed = cursor.execute("""
+                SELECT COUNT(DISTINCT hash) FROM ratio_log WHERE hash NOT IN (SELECT hash FROM snapshot)
+            """).fetchone()[0]
+
+            # Torrents that get today's entry appended to existing history on a purge day lose their oldest entry
+            cursor.execute("DROP TABLE IF EXISTS temp.purge")
+            cursor.execute("CREATE TEMP TABLE purge (hash TEXT PRIMARY KEY)")
+            if purge_days:
+                placeholders = ','.join('?' * len(purge_days))
+                cursor.execute(f"""
+                    INSERT INTO purge (hash)
+                    SELECT s.hash FROM snapshot AS s
+                    WHERE s.seed_days IN ({placeholders})
+                      AND EXISTS (SELECT 1 FROM ratio_log AS r WHERE r.hash = s.hash)
+                      AND NOT EXISTS (SELECT 1 FROM ratio_log AS r WHERE r.hash = s.hash AND r.date = ?)
+                """, (*purge_days, current_date))
+
+            cursor.execute("INSERT OR IGNORE INTO ratio_log (hash, date, ratio) SELECT hash, ?, ratio FROM snapshot",
+                           (current_date,))
+            cursor.execute("""
+                DELETE FROM ratio_log WHERE (hash, date) IN (
+                    SELECT r.hash, MIN(r.date) FROM ratio_log AS r JOIN purge AS p ON p.hash = r.hash GROUP BY r.hash
+                )
+            """)
+            cursor.execute("DELETE FROM ratio_log WHERE hash NOT IN (SELECT hash FROM snapshot)")
+            if max_entries > 0:
+                cursor.execute("""
+                    DELETE FROM ratio_log WHERE (hash, date) IN (
+                        SELECT hash, date FROM (
+                            SELECT hash, date, ROW_NUMBER() OVER (PARTITION BY hash ORDER BY date DESC) AS newer
+                            FROM ratio_log
+                        ) WHERE newer > ?
+                    )
+                """, (max_entries,))
+
+            torrents_with_max_entries = cursor.execute("""
+                SELECT COUNT(*) FROM (SELECT hash FROM ratio_log GROUP BY hash HAVING COUNT(*) >= ?)
+            """, (max_entries,)).fetchone()[0]
+            cursor.execute("DROP TABLE temp.snapshot")
+            cursor.execute("DROP TABLE temp.purge")
+        return total_torrents, new_torrents_added, torrents_removed, torrents_with_max_entries
+
+    def import_ratio_log(self, ratio_log: Dict[str, List[Dict[str, Any]]]) -> int:
+        """Replace the stored history with a JSON ratio log. Returns the number of rows imported."""
+        rows = [(torrent_hash, record['date'], record['ratio'])
+                for torrent_hash, records in ratio_log.items() for record in records]
+        with self.connection:
+            self.connection.execute("DELETE FROM ratio_log")
+            self.connection.executemany("INSERT OR REPLACE INTO ratio_log (hash, date, ratio) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+
+def _day_number(iso_date: str) -> int:
+    """Day ordinal of a 'YYYY-MM-DD' date (date.fromisoformat needs Python 3.7)."""
+    return datetime.strptime(iso_date, '%Y-%m-%d').toordinal()
+
+
+class RingRatioStore(RatioHistory):
+    """
+    Ratio history as a fixed-size window per torrent: the last max_entries ratios in a ring
+    buffer, plus the date of the newest one. All torrents share flat arrays (slot i owns
+    ratios[i * capacity:(i + 1) * capacity]), so a daily snapshot is a constant-time update per
+    torrent and summary() reads the oldest ratio and the record count directly. The trimming
+    is the same as torrent_ratio_logger.process_torrent_data.
+
+    The file is a JSON header line (capacity, byte order and the hash of every slot, '' for a
+    free slot) followed by the raw arrays.
+    """
+
+    def __init__(self, path: str, capacity: int = 0):
+        super().__init__()
+        self.path = path
+        self._clear(capacity)
+
+    def _clear(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._hashes: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._ratios = array('d')
+        self._heads = array('i')
+        self._counts = array('i')
+        self._last_days = array('i')
+
+    @classmethod
+    def load(cls, path: str) -> 'RingRatioStore':
+        """Load the store from path; a missing file is an empty store."""
+        store = cls(path)
+        try:
+            with open(path, 'rb') as file:
+                header = json.loads(file.readline())
+                if header.get('version') != RING_FORMAT_VERSION:
+                    raise ValueError(f"unsupported version {header.get('version')}")
+                store.capacity = header['capacity']
+                store._hashes = header['hashes']
+                slots = len(store._hashes)
+                store._ratios.fromfile(file, slots * store.capacity)
+                for values in (store._heads, store._counts, store._last_days):
+                    values.fromfile(file, slots)
+        except FileNotFoundError:
+            return store
+        except (EOFError, KeyError, ValueError) as e:
+            raise ValueError(f"Error reading ratio log {path}: {e}")
+        if header.get('byteorder') != sys.byteorder:
+            for values in (store._ratios, store._heads, store._counts, store._last_days):
+                values.byteswap()
+        for slot, torrent_hash in enumerate(store._hashes):
+            if torrent_hash:
+                store._index[torrent_hash] = slot
+            else:
+                store._free.append(slot)
+        return store
+
+    def save(self) -> None:
+        """Write the store atomically."""
+        header = {'version': RING_FORMAT_VERSION, 'capacity': self.capacity, 'byteorder': sys.byteorder,
+                  'hashes': self._hashes}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(json.dumps(header).encode() + b'\n')
+            for values in (self._ratios, self._heads, self._counts, self._last_days):
+                values.tofile(file)
+        os.replace(temp_path, self.path)
+
+    def summary(self, torrent_hash: str) -> Tuple[Optional[float], int]:
+        slot = self._index.get(torrent_hash)
+        if slot is None:
+            return None, 0
+        return self._ratios[slot * self.capacity + self._heads[slot]], self._counts[slot]
+
+    def __contains__(self, torrent_hash: str) -> bool:
+        return torrent_hash in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def ratios(self, torrent_hash: str) -> List[float]:
+        """The retained ratios of a torrent, oldest first."""
+        slot = self._index.get(torrent_hash)
+        if slot is None:
+            return []
+        base, head, capacity = slot * self.capacity, self._heads[slot], self.capacity
+        return [self._ratios[base + (head + i) % capacity] for i in range(self._counts[slot])]
+
+    def resize(self, capacity: int) -> None:
+        """Change the window to capacity (at least 1) ratios per torrent, keeping the newest ones."""
+        capacity = max(1, capacity)
+        if capacity == self.capacity:
+            return
+        ratios = array('d', bytes(len(self._hashes) * capacity * self._ratios.itemsize))
+        for slot in self._index.values():
+            kept = self.ratios(self._hashes[slot])[-capacity:]
+            ratios[slot * capacity:slot * capacity + len(kept)] = array('d', kept)
+            self._heads[slot] = 0
+            self._counts[slot] = len(kept)
+        self._ratios = ratios
+        self.capacity = capacity
+
+    def _allocate(self, torrent_hash: str) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._hashes[slot] = torrent_hash
+        else:
+            slot = len(self._hashes)
+            self._hashes.append(torrent_hash)
+            self._ratios.frombytes(bytes(self.capacity * self._ratios.itemsize))
+            for values in (self._heads, self._counts, self._last_days):
+                values.append(0)
+        self._index[torrent_hash] = slot
+        self._heads[slot] = self._counts[slot] = 0
+        return slot
+
+    def _release(self, torrent_hash: str) -> None:
+        slot = self._index.pop(torrent_hash)
+        self._hashes[slot] = ''
+        self._counts[slot] = 0
+        self._free.append(slot)
+
+    def _append(self, slot: int, ratio: float, purge: bool, bounded: bool = True) -> None:
+        """
+        Append a ratio; on a purge day the oldest one is dropped first, then the window is trimmed
+        to capacity. An unbounded window doubles the capacity of every slot instead of trimming.
+        """
+        count = self._counts[slot]
+        drop = 1 if purge and count > 0 else 0
+        if count - drop + 1 > self.capacity:
+            if bounded:
+                drop += 1
+            else:
+                self.resize(self.capacity * 2)
+        head = self._heads[slot]
+        head = (head + drop) % self.capacity
+        count -= drop
+        self._ratios[slot * self.capacity + (head + count) % self.capacity] = ratio
+        self._heads[slot] = head
+        self._counts[slot] = count + 1
+
+    def record_snapshot(self, torrents: List[Dict[str, Any]], current_date: str, max_entries: int,
+                        purge_days: List[int]) -> Tuple[int, int, int, int]:
+        """
+        Add today's ratio of every torrent and drop the torrents that are gone. max_entries <= 0
+        keeps every ratio, like the other backends.
+        Returns (torrents in log, new torrents added, torrents removed, torrents with max entries).
+        """
+        bounded = max_entries > 0
+        if bounded or not self.capacity:
+            self.resize(max_entries)
+        today = _day_number(current_date)
+        purge = set(purge_days)
+        current_hashes = set()
+        new_torrents_added = 0
+        for torrent in torrents:
+            torrent_hash = torrent['hash']
+            current_hashes.add(torrent_hash)
+            slot = self._index.get(torrent_hash)
+            if slot is None:
+                slot = self._allocate(torrent_hash)
+                new_torrents_added += 1
+            elif self._last_days[slot] == today:
+                continue
+            self._append(slot, torrent['ratio'], torrent['seeding_time'] // SECONDS_PER_DAY in purge, bounded)
+            self._last_days[slot] = today
+
+        removed = [torrent_hash for torrent_hash in self._index if torrent_hash not in current_hashes]
+        for torrent_hash in removed:
+            self._release(torrent_hash)
+        torrents_with_max_entries = sum(1 for slot in self._index.values() if self._counts[slot] >= max_entries)
+        return len(current_hashes), new_torrents_added, len(removed), torrents_with_max_entries
+
+    def import_ratio_log(self, ratio_log: Dict[str, List[Dict[str, Any]]], max_entries: int) -> int:
+        """
+        Replace the stored history with a JSON ratio log, trimmed to max_entries (all of it if
+        max_entries <= 0). Returns the number of ratios kept.
+        """
+        if max_entries <= 0:
+            max_entries = max((len(records) for records in ratio_log.values()), default=1)
+        self._clear(max(1, max_entries))
+        for torrent_hash, records in ratio_log.items():
+            if not records:
+                continue
+            slot = self._allocate(torrent_hash)
+            for record in records[-self.capacity:]:
+                self._append(slot, record['ratio'], False)
+            self._last_days[slot] = _day_number(records[-1]['date'])
+        return sum(self._counts[slot] for slot in self._index.values())
+
+
+def get_ratio_log_location(config: configparser.ConfigParser, script_directory: str) -> Tuple[str, str]:
+    """Return (backend, file path) of the configured ratio log."""
+    backend = config.get('torrent_ratio_logger', 'backend', fallback='json').strip().lower()
+    if backend not in RATIO_LOG_BACKENDS:
+        raise ValueError(f"Invalid ratio log backend '{backend}', expected one of: {', '.join(RATIO_LOG_BACKENDS)}")
+    file_name = {'json': JSON_LOG_FILE, 'sqlite': SQLITE_LOG_FILE, 'ring': RING_LOG_FILE}[backend]
+    return backend, os.path.join(script_directory, file_name)
+
+
+def load_ratio_history(config: configparser.ConfigParser, script_directory: str) -> RatioHistory:
+    """Load the ratio history from the configured backend."""
+    backend, log_file_path = get_ratio_log_location(config, script_directory)
+    with instrumentation.phase('ratio_history'):
+        if backend == 'sqlite':
+            store = SqliteRatioStore(log_file_path)
+            try:
+                return store.load_history()
+            finally:
+                store.close()
+        if backend == 'ring':
+            return RingRatioStore.load(log_file_path)
+        return RatioHistory.load(log_file_path)
@@ -0,0 +1,398 @@
+import configparser
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, NamedTuple, Optional, Tuple
+
+# Constants
+HARDLINK_MODES = ('api', 'scan')
+SCORING_ENGINES = ('auto', 'numpy', 'python')
+API_CLIENTS = ('requests', 'asyncio')
+SPACE_SELECTIONS = ('greedy', 'optimal')
+INSTANCE_SECTION_PREFIX = 'instance:'
+MOUNT_SECTION_PREFIX = 'mount:'
+MOUNT_OPTIONS = ('min_space_gb', 'download_minspace_gb')
+INSTANCE_OPTIONS = ('address', 'username', 'password', 'drive_path', 'qbt_prefix', 'actual_prefix',
+                    'min_space_gb', 'download_minspace_gb')
+SEED_RULE_KEYS = ('min_seed_time', 'min_ratio')
+BONUS_RULE_KEYS = ('min_weeks', 'time_multipliers', 'size_multipliers', 'extra_multiplier_weeks', 'extra_multiplier_value')
+
+
+class ConfigError(ValueError):
+    """Raised when config.ini cannot be compiled into Rules; lists every problem found."""
+
+
+class Login(NamedTuple):
+    address: str
+    username: str
+    password: str
+
+
+class ApiSettings(NamedTuple):
+    client: str
+    max_concurrency: int
+    timeout_seconds: float
+    retries: int
+    retry_backoff_seconds: float
+    stream_torrent_list: bool
+
+
+class DeletePacing(NamedTuple):
+    """Budget for releasing deletions in batches; unlimited (all at once) when both budgets are 0."""
+    rate_mb_per_second: float
+    torrents_per_interval: int
+    interval_seconds: float
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_mb_per_second > 0 or self.torrents_per_interval > 0
+
+
+class ForecastSettings(NamedTuple):
+    enabled: bool
+    horizon_hours: float
+    history_hours: float
+    max_step_gb: float
+
+
+class SeedRule(NamedTuple):
+    min_seed_time: Optional[float]
+    min_ratio: Optional[float]
+
+
+class MultiplierTable(NamedTuple):
+    """Thresholds in ascending order and their multipliers, ready for bisect."""
+    thresholds: Tuple[float, ...]
+    multipliers: Tuple[float, ...]
+
+    def lookup(self, value: float) -> float:
+        """Multiplier of the highest threshold <= value, 1.0 below the first threshold."""
+        index = bisect_right(self.thresholds, value)
+        return self.multipliers[index - 1] if index else 1.0
+
+
+class BonusRule(NamedTuple):
+    min_weeks: Optional[float]
+    time_multipliers: Optional[MultiplierTable]
+    size_multipliers: Optional[MultiplierTable]
+    extra_multiplier_weeks: Optional[float]
+    extra_multiplier_value: Optional[float]
+
+
+class PathMapping(NamedTuple):
+    qbt_prefix: str
+    actual_prefix: str
+
+    def translate(self, qbt_path: str) -> str:
+        """Translate qBittorrent's reported path to actual filesystem path."""
+        if qbt_path.startswith(self.qbt_prefix):
+            return qbt_path.replace(self.qbt_prefix, self.actual_prefix, 1)
+        return qbt_path
+
+
+class MountTarget(NamedTuple):
+    """Free space to keep on the filesystem that 'path' is on."""
+    path: str
+    min_space_gb: float
+    download_minspace_gb: Optional[float]
+
+
+class Rules(NamedTuple):
+    """Immutable, validated view of config.ini used by the whole cleanup pipeline."""
+    login: Login
+    api: ApiSettings
+    seed_rules: Mapping[str, SeedRule]
+    bonus_rules: Mapping[str, BonusRule]
+    path_mapping: PathMapping
+    categories_space: Tuple[str, ...]
+    categories_count: Tuple[str, ...]
+    min_space_gb: float
+    download_minspace_gb: Optional[float]
+    mount_targets: Tuple[MountTarget, ...]
+    max_torrents_for_categories: int
+    sort_count_removal_by_size: bool
+    space_selection: str
+    selection_time_budget: float
+    selection_exact_limit: int
+    drive_path: str
+    check_hardlinks: bool
+    hardlink_mode: str
+    hardlink_workers: int
+    hardlink_cache_hours: float
+    delete_batch_size: int
+    delete_pacing: DeletePacing
+    forecast: ForecastSettings
+    min_ratio_change: float
+    min_weeks_seeded: float
+    scoring_engine: str
+
+
+class _Reader:
+    """Typed config getters that record errors instead of raising on the first one."""
+
+    def __init__(self, config: configparser.ConfigParser):
+        self.config = config
+        self.errors: List[str] = []
+
+    def get(self, section: str, option: str, fallback: Optional[str] = None) -> str:
+        value = self.config.get(section, option, fallback=fallback)
+        if value is None:
+            self.errors.append(f"[{section}] {option} is required")
+            return ''
+        return value.strip()
+
+    def number(self, section: str, option: str, fallback: Any, cast: Any = float, minimum: Optional[float] = None) -> Any:
+        raw = self.get(section, option, None if fallback is None else str(fallback))
+        if not raw:
+            if fallback is None and self.config.has_option(section, option):
+                self.errors.append(f"[{section}] {option} is required")
+            return cast(fallback or 0)
+        try:
+            value = cast(raw)
+        except ValueError:
+            self.errors.append(f"[{section}] {option} = {raw!r} is not a valid {cast.__name__}")
+            return cast(fallback or 0)
+        if minimum is not None and value < minimum:
+            self.errors.append(f"[{section}] {option} = {raw!r} must be at least {minimum:g}")
+        return value
+
+    def boolean(self, section: str, option: str, fallback: bool) -> bool:
+        try:
+            return self.config.getboolean(section, option, fallback=fallback)
+        except ValueError:
+            self.errors.append(f"[{section}] {option} = {self.config.get(section, option)!r} is not on/off")
+            return fallback
+
+    def choice(self, section: str, option: str, fallback: str, choices: Tuple[str, ...]) -> str:
+        value = self.get(section, option, fallback).lower()
+        if value not in choices:
+            self.errors.append(f"[{section}] {option} = {value!r} must be one of: {', '.join(choices)}")
+            return fallback
+        return value
+
+    def categories(self, section: str, option: str) -> Tuple[str, ...]:
+        return tuple(cat.strip().lower() for cat in self.get(section, option, '').split(',') if cat.strip())
+
+
+def _parse_pairs(rule_string: str, where: str, errors: List[str]) -> List[Tuple[str, str]]:
+    """Split 'key:value, key:value' into pairs; multiplier lists keep their inner commas."""
+    pairs = []
+    for rule in rule_string.split(', '):
+        if ':' not in rule:
+            errors.append(f"{where}: '{rule}' is not key:value")
+            continue
+        key, value = rule.split(':', 1)
+        pairs.append((key.strip(), value.strip()))
+    return pairs
+
+
+def _parse_float(value: str, where: str, errors: List[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        errors.append(f"{where}: '{value}' is not a number")
+        return None
+
+
+def parse_seed_rule(category: str, rule_string: str, errors: List[str]) -> Optional[SeedRule]:
+    """Parse 'min_seed_time:SECONDS, min_ratio:RATIO'."""
+    where = f"[seed_rules] {category}"
+    values: Dict[str, Optional[float]] = {}
+    for key, value in _parse_pairs(rule_string, where, errors):
+        if key not in SEED_RULE_KEYS:
+            errors.append(f"{where}: unknown rule '{key}', expected one of: {', '.join(SEED_RULE_KEYS)}")
+            continue
+        values[key] = _parse_float(value, f"{where} {key}", errors)
+    if not any(value is not None for value in values.values()):
+        errors.append(f"{where}: needs min_seed_time and/or min_ratio")
+        return None
+    return SeedRule(values.get('min_seed_time'), values.get('min_ratio'))
+
+
+def parse_multiplier_table(multiplier_string: str, where: str, errors: List[str]) -> Optional[MultiplierTable]:
+    """Parse 'THRESHOLD:MULTIPLIER,THRESHOLD:MULTIPLIER,...' with ascending thresholds."""
+    thresholds, multipliers = [], []
+    for pair in multiplier_string.split(','):
+        parts = pair.split(':')
+        if len(parts) != 2:
+            errors.append(f"{where}: '{pair}' is not THRESHOLD:MULTIPLIER")
+            return None
+        threshold = _parse_float(parts[0], where, errors)
+        multiplier = _parse_float(parts[1], where, errors)
+        if threshold is None or multiplier is None:
+            return None
+        thresholds.append(threshold)
+        multipliers.append(multiplier)
+    if any(later < earlier for earlier, later in zip(thresholds, thresholds[1:])):
+        errors.append(f"{where}: thresholds must be in ascending order")
+        return None
+    return MultiplierTable(tuple(thresholds), tuple(multipliers))
+
+
+def parse_bonus_rule(category: str, rule_string: str, errors: List[str]) -> Optional[BonusRule]:
+    """Parse a [bonus_rules] line into a BonusRule."""
+    where = f"[bonus_rules] {category}"
+    values: Dict[str, Any] = {}
+    for key, value in _parse_pairs(rule_string, where, errors):
+        if key not in BONUS_RULE_KEYS:
+            errors.append(f"{where}: unknown rule '{key}', expected one of: {', '.join(BONUS_RULE_KEYS)}")
+        elif key in ('time_multipliers', 'size_multipliers'):
+            values[key] = parse_multiplier_table(value, f"{where} {key}", errors)
+        else:
+            values[key] = _parse_float(value, f"{where} {key}", errors)
+    if ('extra_multiplier_weeks' in values) != ('extra_multiplier_value' in values):
+        errors.append(f"{where}: extra_multiplier_weeks and extra_multiplier_value must be set together")
+    if not values:
+        return None
+    return BonusRule(values.get('min_weeks'), values.get('time_multipliers'), values.get('size_multipliers'),
+                     values.get('extra_multiplier_weeks'), values.get('extra_multiplier_value'))
+
+
+def _read_api_settings(reader: _Reader) -> ApiSettings:
+    return ApiSettings(
+        client=reader.choice('api', 'client', 'requests', API_CLIENTS),
+        max_concurrency=reader.number('api', 'max_concurrency', 8, int, minimum=1),
+        timeout_seconds=reader.number('api', 'timeout_seconds', 30.0, minimum=1),
+        retries=reader.number('api', 'retries', 3, int, minimum=0),
+        retry_backoff_seconds=reader.number('api', 'retry_backoff_seconds', 0.5, minimum=0),
+        stream_torrent_list=reader.boolean('api', 'stream_torrent_list', False),
+    )
+
+
+def _read_mount_targets(config: configparser.ConfigParser, reader: _Reader) -> Tuple[MountTarget, ...]:
+    targets = []
+    for section in config.sections():
+        if not section.lower().startswith(MOUNT_SECTION_PREFIX):
+            continue
+        path = section[len(MOUNT_SECTION_PREFIX):].strip()
+        if not path:
+            reader.errors.append(f"[{section}]: a mount path is required, e.g. [mount:/mnt/disk1]")
+            continue
+        for option in config[section]:
+            if option not in MOUNT_OPTIONS and not config.has_option(configparser.DEFAULTSECT, option):
+                reader.errors.append(f"[{section}] unknown option '{option}', expected one of: {', '.join(MOUNT_OPTIONS)}")
+        download_minspace = reader.get(section, 'download_minspace_gb', '')
+        targets.append(MountTarget(
+            path=path,
+            min_space_gb=reader.number(section, 'min_space_gb', 0, minimum=0),
+            download_minspace_gb=reader.number(section, 'download_minspace_gb', 0, minimum=0) if download_minspace else None,
+        ))
+    return tuple(targets)
+
+
+def compile_rules(config: configparser.ConfigParser, default_drive_path: str) -> Rules:
+    """
+    Validate config.ini and compile it into an immutable Rules object.
+    Raises ConfigError listing every problem found.
+    """
+    reader = _Reader(config)
+    errors = reader.errors
+
+    # With [instance:NAME] sections the login details live there and [login] only holds shared defaults
+    login_fallback = '' if get_instance_sections(config) else None
+    login = Login(reader.get('login', 'address', login_fallback), reader.get('login', 'username', login_fallback),
+                  reader.get('login', 'password', login_fallback))
+
+    seed_rules = {}
+    if config.has_section('seed_rules'):
+        for category, rule_string in config['seed_rules'].items():
+            seed_rule = parse_seed_rule(category, rule_string, errors)
+            if seed_rule is not None:
+                seed_rules[category.lower()] = seed_rule
+
+    bonus_rules = {}
+    if config.has_section('bonus_rules'):
+        for category, rule_string in config['bonus_rules'].items():
+            bonus_rule = parse_bonus_rule(category, rule_string, errors)
+            if bonus_rule is not None:
+                bonus_rules[category.lower()] = bonus_rule
+
+    categories_space = reader.categories('cleanup', 'categories_to_check_for_space')
+    categories_count = reader.categories('cleanup', 'categories_to_check_for_number')
+
+    download_minspace = reader.get('cleanup', 'download_minspace_gb', '')
+    download_minspace_gb = reader.number('cleanup', 'download_minspace_gb', 0, minimum=0) if download_minspace else None
+    max_torrents = (reader.number('cleanup', 'max_torrents_for_categories', None, int, minimum=0)
+                    if categories_count else reader.number('cleanup', 'max_torrents_for_categories', 0, int))
+
+    rules = Rules(
+        login=login,
+        api=_read_api_settings(reader),
+        seed_rules=MappingProxyType(seed_rules),
+        bonus_rules=MappingProxyType(bonus_rules),
+        path_mapping=PathMapping(reader.get('path_mapping', 'qbt_prefix', '/ssd'),
+                                 reader.get('path_mapping', 'actual_prefix', '/mnt/nvme')),
+        categories_space=categories_space,
+        categories_count=categories_count,
+        min_space_gb=reader.number('cleanup', 'min_space_gb', None, minimum=0),
+        download_minspace_gb=download_minspace_gb,
+        mount_targets=_read_mount_targets(config, reader),
+        max_torrents_for_categories=max_torrents,
+        sort_count_removal_by_size=reader.boolean('cleanup', 'sort_count_removal_by_size', False),
+        space_selection=reader.choice('cleanup', 'space_selection', 'greedy', SPACE_SELECTIONS),
+        selection_time_budget=reader.number('cleanup', 'selection_time_budget_seconds', 2.0, minimum=0),
+        selection_exact_limit=reader.number('cleanup', 'selection_exact_limit', 5000, int, minimum=0),
+        drive_path=reader.get('cleanup', 'drive_path', '') or default_drive_path,
+        check_hardlinks=reader.boolean('cleanup', 'check_hardlinks', True),
+        hardlink_mode=reader.choice('cleanup', 'hardlink_mode', 'api', HARDLINK_MODES),
+        hardlink_workers=reader.number('cleanup', 'hardlink_workers', 8, int, minimum=1),
+        hardlink_cache_hours=reader.number('cleanup', 'hardlink_cache_hours', 12.0, minimum=0),
+        delete_batch_size=reader.number('cleanup', 'delete_batch_size', 100, int, minimum=0),
+        delete_pacing=DeletePacing(reader.number('cleanup', 'delete_rate_mb_per_second', 0.0, minimum=0),
+                                   reader.number('cleanup', 'delete_torrents_per_interval', 0, int, minimum=0),
+                                   reader.number('cleanup', 'delete_interval_seconds', 30.0, minimum=0)),
+        forecast=ForecastSettings(reader.boolean('forecast', 'enabled', False),
+                                  reader.number('forecast', 'horizon_hours', 12.0, minimum=0),
+                                  reader.number('forecast', 'history_hours', 24.0, minimum=0),
+                                  reader.number('forecast', 'max_step_gb', 50.0, minimum=0)),
+        min_ratio_change=reader.number('ratio_calculation', 'min_ratio_change', 0.3),
+        min_weeks_seeded=reader.number('ratio_calculation', 'min_weeks_seeded', 3),
+        scoring_engine=reader.choice('ratio_calculation', 'scoring_engine', 'auto', SCORING_ENGINES),
+    )
+    if errors:
+        raise ConfigError("Invalid configuration:\n  " + "\n  ".join(errors))
+    return rules
+
+
+def get_instance_sections(config: configparser.ConfigParser) -> List[str]:
+    return [section for section in config.sections() if section.lower().startswith(INSTANCE_SECTION_PREFIX)]
+
+
+def compile_instances(config: configparser.ConfigParser, default_drive_path: str) -> List[Tuple[str, Rules]]:
+    """
+    Return (name, Rules) for every [instance:NAME] section, or [('', rules)] for a single
+    instance configured in [login]. Instance sections override the login details, the path
+    mapping and the space settings; every other setting is shared.
+    """
+    rules = compile_rules(config, default_drive_path)
+    sections = get_instance_sections(config)
+    if not sections:
+        return [('', rules)]
+
+    reader = _Reader(config)
+    errors = reader.errors
+    instances = []
+    for section in sections:
+        name = section[len(INSTANCE_SECTION_PREFIX):].strip()
+        if not name or any(name == other for other, _ in instances):
+            errors.append(f"[{section}]: instance names must be unique and not empty")
+            continue
+        for option in config[section]:
+            if option not in INSTANCE_OPTIONS and not config.has_option(configparser.DEFAULTSECT, option):
+                errors.append(f"[{section}] unknown option '{option}', expected one of: {', '.join(INSTANCE_OPTIONS)}")
+        login = Login(reader.get(section, 'address'), reader.get(section, 'username', rules.login.username),
+                      reader.get(section, 'password', rules.login.password))
+        if not login.username:
+            errors.append(f"[{section}] username is required (or set it in [login])")
+        download_minspace = reader.get(section, 'download_minspace_gb', '')
+        instances.append((name, rules._replace(
+            login=login,
+            path_mapping=PathMapping(reader.get(section, 'qbt_prefix', rules.path_mapping.qbt_prefix),
+                                     reader.get(section, 'actual_prefix', rules.path_mapping.actual_prefix)),
+            drive_path=reader.get(section, 'drive_path', '') or rules.drive_path,
+            min_space_gb=reader.number(section, 'min_space_gb', rules.min_space_gb, minimum=0),
+            download_minspace_gb=(reader.number(section, 'download_minspace_gb', 0, minimum=0)
+                                  if download_minspace else rules.download_minspace_gb),
+        )))
+    if errors:
+        raise ConfigError("Invalid configuration:\n  " + "\n  ".join(errors))
+    return instances
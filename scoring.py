@@ -0,0 +1,101 @@
+from typing import Dict, List, Any
+from logging import Logger
+import torrent_utils
+import instrumentation
+from ratio_history import RatioHistory
+from rules import Rules, MultiplierTable
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the scalar path is used without it
+    np = None
+
+# Constants
+SECONDS_PER_WEEK = 7 * 86400
+BYTES_TO_GB = 1024**3
+
+
+def get_scoring_engine(rules: Rules, logger: Logger) -> str:
+    """Return 'numpy' or 'python' according to the scoring_engine option and NumPy availability."""
+    engine = rules.scoring_engine
+    if engine == 'python':
+        return 'python'
+    if np is None:
+        if engine == 'numpy':
+            logger.warning("scoring_engine is numpy but NumPy is not installed, using the Python engine")
+        return 'python'
+    return 'numpy'
+
+
+def score_torrents(torrents: List[Dict[str, Any]], ratio_history: RatioHistory, logger: Logger, rules: Rules) -> List[float]:
+    """
+    Return the average ratio change per week of every torrent, the same values
+    torrent_utils.calculate_average_ratio returns one torrent at a time.
+    """
+    if not torrents:
+        return []
+    with instrumentation.phase('scoring'):
+        if get_scoring_engine(rules, logger) == 'python':
+            return [torrent_utils.calculate_average_ratio(torrent, ratio_history, logger, rules) for torrent in torrents]
+        return _score_torrents_numpy(torrents, ratio_history, rules).tolist()
+
+
+def _lookup_multipliers(values: 'np.ndarray', table: MultiplierTable) -> 'np.ndarray':
+    """Vectorized MultiplierTable.lookup: the last threshold <= value wins, 1.0 if none."""
+    thresholds = np.array(table.thresholds, dtype=np.float64)
+    factors = np.array(table.multipliers, dtype=np.float64)
+    index = np.searchsorted(thresholds, values, side='right') - 1
+    return np.where(index >= 0, factors[np.maximum(index, 0)], 1.0)
+
+
+def _score_torrents_numpy(torrents: List[Dict[str, Any]], ratio_history: RatioHistory, rules: Rules) -> 'np.ndarray':
+    count = len(torrents)
+    current_ratio = np.fromiter((torrent['ratio'] for torrent in torrents), dtype=np.float64, count=count)
+    weeks_seeded = np.fromiter((torrent.get('seeding_time', 0) for torrent in torrents), dtype=np.float64, count=count) / SECONDS_PER_WEEK
+    size_gb = np.fromiter((torrent.get('size', 0) for torrent in torrents), dtype=np.float64, count=count) / BYTES_TO_GB
+    summaries = [ratio_history.summary(torrent['hash']) for torrent in torrents]
+    has_old = np.fromiter((ratio_old is not None for ratio_old, _ in summaries), dtype=bool, count=count)
+    ratio_old = np.fromiter((ratio_old if ratio_old is not None else 0.0 for ratio_old, _ in summaries), dtype=np.float64, count=count)
+    num_records_weeks = np.fromiter((num_records for _, num_records in summaries), dtype=np.float64, count=count) / 7
+
+    min_ratio_change = rules.min_ratio_change
+    min_weeks_seeded = rules.min_weeks_seeded
+    zeros = np.zeros(count)
+
+    # Torrents with ratio history
+    ratio_change = current_ratio - ratio_old
+    if min_weeks_seeded > 0:
+        clamp = (num_records_weeks <= min_weeks_seeded) & (min_ratio_change > ratio_change)
+        ratio_change = np.where(clamp, min_ratio_change, ratio_change)
+    divide = (ratio_change != 0) & (num_records_weeks > 0)
+    with_history = np.divide(ratio_change, num_records_weeks, out=zeros.copy(), where=divide)
+
+    # Torrents without history
+    seeded = weeks_seeded > 0
+    if min_ratio_change > 0 and min_weeks_seeded > 0:
+        use_minimum = (current_ratio < min_ratio_change) & (weeks_seeded <= min_weeks_seeded)
+    else:
+        use_minimum = np.zeros(count, dtype=bool)
+    numerator = np.where(use_minimum, min_ratio_change, current_ratio)
+    without_history = np.divide(numerator, weeks_seeded, out=zeros.copy(), where=seeded)
+
+    average_ratio_change = np.where(has_old, with_history, without_history)
+
+    # Bonus multipliers, applied in the same order as torrent_utils.apply_bonus_rules
+    multiplier = np.ones(count)
+    categories = [torrent.get('category', '').lower() for torrent in torrents]
+    for category, category_rules in rules.bonus_rules.items():
+        in_category = np.fromiter((torrent_category == category for torrent_category in categories), dtype=bool, count=count)
+        if not in_category.any():
+            continue
+        category_multiplier = np.ones(count)
+        if category_rules.time_multipliers is not None:
+            category_multiplier = category_multiplier * _lookup_multipliers(weeks_seeded, category_rules.time_multipliers)
+        if category_rules.size_multipliers is not None:
+            category_multiplier = category_multiplier * _lookup_multipliers(size_gb, category_rules.size_multipliers)
+        if category_rules.extra_multiplier_weeks is not None and category_rules.extra_multiplier_value is not None:
+            extra = weeks_seeded >= category_rules.extra_multiplier_weeks
+            category_multiplier = np.where(extra, category_multiplier * category_rules.extra_multiplier_value, category_multiplier)
+        multiplier = np.where(in_category, category_multiplier, multiplier)
+
+    return average_ratio_change * multiplier
@@ -0,0 +1,188 @@
+import math
+import time
+from typing import Dict, List, Any, Optional, Sequence
+from logging import Logger
+import torrent_utils
+from rules import Rules
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the pure Python DP uses a coarser size resolution without it
+    np = None
+
+# Constants
+BYTES_TO_GB = 1024**3
+# Upper bound on DP table cells (candidates x size buckets); pure Python is ~50x slower per cell
+MAX_DP_CELLS_NUMPY = 50_000_000
+MAX_DP_CELLS_PYTHON = 2_000_000
+MAX_SIZE_BUCKETS = 1 << 16
+
+
+def select_for_space(ranked_torrents: Sequence[Dict[str, Any]], space_needed: float, rules: Rules,
+                     logger: Logger) -> List[Dict[str, Any]]:
+    """
+    Choose the torrents to remove to free space_needed GB, in removal order.
+
+    'greedy' takes the ranked torrents from the bottom until enough space is freed.
+    'optimal' frees at least as much while losing the least total average ratio change
+    (see select_optimal).
+    """
+    if rules.space_selection == 'greedy':
+        return torrent_utils.select_by_space(ranked_torrents, space_needed)
+    selected = select_optimal(ranked_torrents, space_needed, rules.selection_time_budget,
+                              rules.selection_exact_limit, logger)
+    selected_ids = {id(torrent) for torrent in selected}
+    return [torrent for torrent in ranked_torrents if id(torrent) in selected_ids]
+
+
+def selection_cost(torrents: Sequence[Dict[str, Any]]) -> float:
+    """Seeding value lost by removing the torrents: the sum of their average ratio change per week."""
+    return sum(torrent['average_ratio'] for torrent in torrents)
+
+
+def select_optimal(candidates: Sequence[Dict[str, Any]], space_needed: float, time_budget: float,
+                   exact_limit: int, logger: Logger) -> List[Dict[str, Any]]:
+    """
+    Minimum-cost cover: the set of candidates with at least space_needed GB whose total
+    average_ratio is lowest, solved as a 0/1 knapsack over size buckets.
+
+    Torrents with a score <= 0 cost nothing and are always taken first. The best heuristic
+    solution (worst-first greedy or score-per-GB greedy) bounds the cost, so candidates that
+    alone cost more are dropped before the DP. Sizes are rounded down to whole buckets, so the
+    DP answer always frees enough; with many candidates the buckets get coarser. Above
+    exact_limit candidates, or when the DP runs longer than time_budget seconds, the
+    heuristic solution is returned instead.
+    """
+    needed_bytes = space_needed * BYTES_TO_GB
+    if needed_bytes <= 0:
+        return []
+    if sum(torrent['size'] for torrent in candidates) < needed_bytes:
+        # Not enough space even when removing everything, like the greedy selection
+        return list(candidates)
+
+    free = [torrent for torrent in candidates if torrent['average_ratio'] <= 0]
+    needed_bytes -= sum(torrent['size'] for torrent in free)
+    if needed_bytes <= 0:
+        return torrent_utils.select_by_space(free, space_needed)
+    paid = [torrent for torrent in candidates if torrent['average_ratio'] > 0]
+
+    heuristic = _best_heuristic(paid, needed_bytes)
+    bound = selection_cost(heuristic)
+    paid = [torrent for torrent in paid if torrent['average_ratio'] < bound]
+    if len(paid) > exact_limit:
+        logger.debug(f"Space selection: {len(paid)} candidates exceed the exact limit of {exact_limit}, using the approximation")
+        return free + heuristic
+
+    exact = _select_dp(paid, needed_bytes, time_budget, logger)
+    if exact is None or selection_cost(exact) >= bound:
+        return free + heuristic
+    return free + exact
+
+
+def _best_heuristic(candidates: List[Dict[str, Any]], needed_bytes: float) -> List[Dict[str, Any]]:
+    """The cheaper of worst-first greedy and score-per-GB greedy, each trimmed of unneeded torrents."""
+    worst_first = sorted(candidates, key=torrent_utils.removal_sort_key)
+    by_density = sorted(candidates, key=lambda t: (t['average_ratio'] / max(t['size'], 1), torrent_utils.removal_sort_key(t)))
+    solutions = [_trim(_take_until(order, needed_bytes), needed_bytes) for order in (worst_first, by_density)]
+    return min(solutions, key=selection_cost)
+
+
+def _take_until(ordered: List[Dict[str, Any]], needed_bytes: float) -> List[Dict[str, Any]]:
+    taken, freed = [], 0
+    for torrent in ordered:
+        if freed >= needed_bytes:
+            break
+        taken.append(torrent)
+        freed += torrent['size']
+    return taken
+
+
+def _trim(selected: List[Dict[str, Any]], needed_bytes: float) -> List[Dict[str, Any]]:
+    """Drop the most expensive torrents that are not needed to reach the target."""
+    surplus = sum(torrent['size'] for torrent in selected) - needed_bytes
+    kept = []
+    for torrent in sorted(selected, key=lambda t: t['average_ratio'], reverse=True):
+        if torrent['size'] <= surplus:
+            surplus -= torrent['size']
+        else:
+            kept.append(torrent)
+    return kept
+
+
+def _select_dp(candidates: List[Dict[str, Any]], needed_bytes: float, time_budget: float,
+               logger: Logger) -> Optional[List[Dict[str, Any]]]:
+    """
+    dp[j] = least cost to free at least j buckets. Returns None if the time budget runs out
+    or no combination reaches the target after rounding sizes down.
+    """
+    if not candidates:
+        return None
+    max_cells = MAX_DP_CELLS_NUMPY if np is not None else MAX_DP_CELLS_PYTHON
+    buckets = max(1, min(MAX_SIZE_BUCKETS, max_cells // len(candidates)))
+    bucket_bytes = needed_bytes / buckets
+    weights = [min(buckets, math.floor(torrent['size'] / bucket_bytes)) for torrent in candidates]
+    costs = [torrent['average_ratio'] for torrent in candidates]
+    deadline = time.monotonic() + time_budget
+
+    try:
+        if np is not None:
+            taken = _dp_numpy(weights, costs, buckets, deadline)
+        else:
+            taken = _dp_python(weights, costs, buckets, deadline)
+    except TimeoutError:
+        logger.debug(f"Space selection: exact search exceeded {time_budget:g}s, using the approximation")
+        return None
+    if taken is None:
+        return None
+    return [candidates[index] for index in taken]
+
+
+def _dp_numpy(weights: List[int], costs: List[float], buckets: int, deadline: float) -> Optional[List[int]]:
+    dp = np.full(buckets + 1, np.inf)
+    dp[0] = 0.0
+    choices = []
+    for weight, cost in zip(weights, costs):
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        # Covering j buckets with this torrent leaves max(0, j - weight) to cover with the others
+        shifted = np.empty_like(dp)
+        shifted[:weight] = dp[0]
+        shifted[weight:] = dp[:buckets + 1 - weight]
+        shifted += cost
+        take = shifted < dp
+        dp = np.where(take, shifted, dp)
+        choices.append(np.packbits(take))
+    if not np.isfinite(dp[buckets]):
+        return None
+    taken, j = [], buckets
+    for index in range(len(weights) - 1, -1, -1):
+        if j > 0 and (choices[index][j >> 3] >> (7 - (j & 7))) & 1:
+            taken.append(index)
+            j = max(0, j - weights[index])
+    return taken
+
+
+def _dp_python(weights: List[int], costs: List[float], buckets: int, deadline: float) -> Optional[List[int]]:
+    infinity = float('inf')
+    dp = [infinity] * (buckets + 1)
+    dp[0] = 0.0
+    choices = []
+    for weight, cost in zip(weights, costs):
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        take = bytearray(buckets + 1)
+        # Descending j so dp[j - weight] still holds the previous row
+        for j in range(buckets, 0, -1):
+            candidate = dp[j - weight if j > weight else 0] + cost
+            if candidate < dp[j]:
+                dp[j] = candidate
+                take[j] = 1
+        choices.append(take)
+    if dp[buckets] == infinity:
+        return None
+    taken, j = [], buckets
+    for index in range(len(weights) - 1, -1, -1):
+        if j > 0 and choices[index][j]:
+            taken.append(index)
+            j = max(0, j - weights[index])
+    return taken
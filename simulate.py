@@ -0,0 +1,256 @@
+"""
+Offline rule tuning: replay the cleanup decisions for alternative [seed_rules]/[bonus_rules]
+variants against a saved torrent list and the ratio history, without touching qBittorrent.
+
+Usage:
+    python simulate.py --save-snapshot torrents.json
+    python simulate.py --snapshot torrents.json --variants variants.ini [--free-gb 300] [--workers 4] [--json report.json]
+"""
+import argparse
+import configparser
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Iterable, NamedTuple, Optional
+from logging import Logger
+import torrent_utils
+import pipeline
+import scoring
+from instances import load_instances
+from ratio_history import RatioHistory, load_ratio_history
+from rules import ConfigError, compile_rules
+from space_planner import Disk
+from torrent_record import TorrentRecord
+
+# Constants
+BASELINE = 'baseline'
+# Sections a variant may override, as [SECTION:VARIANT] in the variants file
+VARIANT_SECTIONS = ('seed_rules', 'bonus_rules', 'cleanup', 'ratio_calculation')
+BYTES_TO_GB = 1024**3
+
+ConfigDict = Dict[str, Dict[str, str]]
+
+
+class OfflineInstance:
+    """
+    Stands in for instances.Instance in the pipeline: the variant's rules and no hardlinks,
+    since the hardlink check needs the file lists of the live client.
+    """
+
+    def __init__(self, rules: Any, logger: Logger):
+        self.name = ''
+        self.rules = rules
+        self.logger = logger
+        self.hardlink_checker = self
+
+    def check_many(self, torrents: Iterable[Dict[str, Any]]) -> Dict[str, bool]:
+        return {torrent['hash']: False for torrent in torrents}
+
+
+class VariantResult(NamedTuple):
+    name: str
+    eligible: int
+    removed_for_space: int
+    removed_for_count: int
+    gb_freed: float
+    space_needed_gb: float
+    score_lost: float
+    error: str = ''
+
+
+def load_variants(config: configparser.ConfigParser, variants_path: str) -> Dict[str, ConfigDict]:
+    """
+    Return {name: config as a dict} for the baseline (config.ini as is) and every variant in
+    the variants file. A [SECTION:NAME] section overrides the listed options of SECTION for
+    variant NAME; an empty value removes the option (e.g. the rule of a category).
+    """
+    base = {section: dict(config[section]) for section in config.sections()}
+    variants: Dict[str, ConfigDict] = {BASELINE: base}
+    overrides = configparser.ConfigParser()
+    if not overrides.read(variants_path):
+        raise FileNotFoundError(f"Variants file {variants_path} not found")
+    for section in overrides.sections():
+        target, _, name = section.partition(':')
+        if target not in VARIANT_SECTIONS or not name:
+            raise ConfigError(f"Invalid variant section [{section}], expected [SECTION:NAME] with SECTION one of: "
+                              f"{', '.join(VARIANT_SECTIONS)}")
+        variant = variants.setdefault(name, {key: dict(options) for key, options in base.items()})
+        options = variant.setdefault(target, {})
+        for option, value in overrides[section].items():
+            if value.strip():
+                options[option] = value
+            else:
+                options.pop(option, None)
+    return variants
+
+
+def load_snapshot(snapshot_path: str) -> List[TorrentRecord]:
+    """Load a saved /torrents/info response (a JSON array of torrents)."""
+    with open(snapshot_path, 'r') as file:
+        torrents = json.load(file, object_hook=TorrentRecord.from_json)
+    if not isinstance(torrents, list):
+        raise ValueError(f"{snapshot_path} is not a JSON array of torrents")
+    return torrents
+
+
+def save_snapshot(config: configparser.ConfigParser, script_directory: str, snapshot_path: str, logger: Logger) -> int:
+    """Fetch the torrent lists of all configured instances into snapshot_path. Returns the number of torrents."""
+    instances = load_instances(config, script_directory, logger)
+    try:
+        torrents = [torrent.to_dict() if isinstance(torrent, TorrentRecord) else torrent
+                    for instance in instances for torrent in instance.fetch_torrents()]
+    finally:
+        for instance in instances:
+            instance.close()
+    with open(snapshot_path, 'w') as file:
+        json.dump(torrents, file)
+    return len(torrents)
+
+
+# Loaded once per worker process by _load_shared and shared by every variant it simulates
+_shared_path = ''
+_torrents: List[TorrentRecord] = []
+_ratio_history = RatioHistory()
+_baseline_scores: Dict[str, float] = {}
+_free_gb = 0.0
+
+
+def _load_shared(shared_path: str) -> None:
+    """Load the pickled (torrents, ratio history, baseline scores, free GB) unless this process already has."""
+    global _shared_path, _torrents, _ratio_history, _baseline_scores, _free_gb
+    if shared_path == _shared_path:
+        return
+    with open(shared_path, 'rb') as file:
+        _torrents, _ratio_history, _baseline_scores, _free_gb = pickle.load(file)
+    _shared_path = shared_path
+
+
+def simulate_variant(name: str, variant: ConfigDict, script_directory: str, shared_path: str) -> VariantResult:
+    """
+    Run the rule filter, scoring and the space and count planning of the cleanup for one
+    variant, with every torrent on a single disk with _free_gb free. Nothing is deleted.
+    """
+    _load_shared(shared_path)
+    logger = logging.getLogger('simulate')
+    try:
+        rules = compile_rules(_config_from_dict(variant), script_directory)
+    except ConfigError as e:
+        return VariantResult(name, 0, 0, 0, 0.0, 0.0, 0.0, str(e).replace('\n', ' '))
+
+    instance = OfflineInstance(rules, logger)
+    candidates = pipeline.Candidates(instance, _torrents, _ratio_history)
+    disk = Disk(0, rules.drive_path)
+    disk.add_target(rules.min_space_gb, rules.download_minspace_gb)
+    disk.free_space = _free_gb
+    disk.instances.append(instance)
+    disk.candidates[instance] = candidates.eligible
+    for torrent in candidates.downloading:
+        disk.remaining_download_gb += torrent['size'] * (1 - torrent['progress']) / BYTES_TO_GB
+    space_needed, additional_space_needed = disk.space_needed()
+
+    pipeline.plan_space_removals(disk, {instance: candidates}, logger)
+    pipeline.plan_count_removals(candidates)
+    reasons = list(candidates.selection_reasons.values())
+    selected = list(candidates.selected.values())
+    return VariantResult(name, len(candidates.eligible), reasons.count('space'), reasons.count('count'),
+                         sum(torrent['size'] for torrent in selected) / BYTES_TO_GB,
+                         max(space_needed, additional_space_needed),
+                         sum(_baseline_scores.get(torrent['hash'], 0.0) for torrent in selected))
+
+
+def run_simulation(variants: Dict[str, ConfigDict], torrents: List[TorrentRecord], ratio_history: RatioHistory,
+                   free_gb: float, script_directory: str, workers: Optional[int], logger: Logger) -> List[VariantResult]:
+    """
+    Simulate every variant on a process pool. The torrents, the ratio history and the baseline
+    scores are pickled once to a temporary file that each worker loads once, instead of being
+    sent per variant. Score lost is measured with the baseline's scoring, so variants with other
+    bonus rules stay comparable.
+    """
+    baseline_rules = compile_rules(_config_from_dict(variants[BASELINE]), script_directory)
+    completed = [torrent for torrent in torrents if torrent.get('state') != 'downloading']
+    baseline_scores = dict(zip((torrent['hash'] for torrent in completed),
+                               scoring.score_torrents(completed, ratio_history, logger, baseline_rules)))
+    fd, shared_path = tempfile.mkstemp(prefix='simulate_', suffix='.pickle')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((torrents, ratio_history, baseline_scores, free_gb), file, pickle.HIGHEST_PROTOCOL)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(simulate_variant, name, variant, script_directory, shared_path)
+                       for name, variant in variants.items()]
+            return [future.result() for future in futures]
+    finally:
+        os.remove(shared_path)
+
+
+def _config_from_dict(variant: ConfigDict) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    config.read_dict(variant)
+    return config
+
+
+def format_report(results: List[VariantResult]) -> str:
+    """A table of the variants, with the GB freed and score lost relative to the baseline."""
+    baseline = next((result for result in results if result.name == BASELINE and not result.error), None)
+    width = max(len(result.name) for result in results)
+    lines = [f"{'variant':<{width}} {'eligible':>8} {'space':>6} {'count':>6} {'GB freed':>10} {'needed':>8} "
+             f"{'score lost':>10} {'vs baseline':>22}"]
+    for result in results:
+        if result.error:
+            lines.append(f"{result.name:<{width}} error: {result.error}")
+            continue
+        difference = ''
+        if baseline is not None and result is not baseline:
+            difference = f"{result.gb_freed - baseline.gb_freed:+.1f} GB, {result.score_lost - baseline.score_lost:+.3f}"
+        lines.append(f"{result.name:<{width}} {result.eligible:>8} {result.removed_for_space:>6} "
+                     f"{result.removed_for_count:>6} {result.gb_freed:>10.1f} {result.space_needed_gb:>8.1f} "
+                     f"{result.score_lost:>10.3f} {difference:>22}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay the cleanup decisions for rule variants offline.")
+    parser.add_argument('--snapshot', help="torrent list to simulate on (a saved /torrents/info JSON array)")
+    parser.add_argument('--save-snapshot', metavar='PATH', help="fetch the torrent lists of the configured instances into PATH and exit")
+    parser.add_argument('--variants', help="INI file with [seed_rules:NAME], [bonus_rules:NAME], ... override sections")
+    parser.add_argument('--free-gb', type=float, help="free space to simulate (default: current free space of drive_path)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--json', metavar='PATH', help="also write the report as JSON to PATH")
+    args = parser.parse_args(argv)
+
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    config = torrent_utils.load_configuration(script_directory)
+    logger = logging.getLogger('simulate')
+    logging.basicConfig(format='%(levelname)s - %(message)s', level=logging.WARNING)
+
+    if args.save_snapshot:
+        count = save_snapshot(config, script_directory, args.save_snapshot, logger)
+        print(f"Saved {count} torrents to {args.save_snapshot}")
+        return
+    if not args.snapshot or not args.variants:
+        parser.error("--snapshot and --variants are required (or --save-snapshot)")
+
+    try:
+        variants = load_variants(config, args.variants)
+        torrents = load_snapshot(args.snapshot)
+        ratio_history = load_ratio_history(config, script_directory)
+        free_gb = args.free_gb
+        if free_gb is None:
+            free_gb = torrent_utils.get_free_space(compile_rules(config, script_directory).drive_path)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+
+    print(f"{len(torrents)} torrents, {len(ratio_history)} ratio histories, {free_gb:.1f} GB free, "
+          f"{len(variants)} variants (hardlinks are not checked offline)")
+    results = run_simulation(variants, torrents, ratio_history, free_gb, script_directory, args.workers, logger)
+    print(format_report(results))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump([result._asdict() for result in results], file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+from typing import Dict, List, Any, Optional, Tuple
+from logging import Logger
+import torrent_utils
+import instrumentation
+from instances import Instance
+
+
+class Disk:
+    """One filesystem: its free space targets, the downloads writing to it and its removal candidates."""
+
+    def __init__(self, device: int, mount_point: str):
+        self.device = device
+        self.mount_point = mount_point
+        self.min_space_gb: Optional[float] = None
+        self.download_minspace_gb: Optional[float] = None
+        self.remaining_download_gb = 0.0
+        # Torrents downloading to this disk, and the GB to free ahead of time set by the forecast
+        self.downloads: List[Dict[str, Any]] = []
+        self.forecast_gb = 0.0
+        self.free_space = 0.0
+        # Instances whose drive_path is on this disk
+        self.instances: List[Instance] = []
+        self.candidates: Dict[Instance, List[Dict[str, Any]]] = {}
+
+    def add_target(self, min_space_gb: float, download_minspace_gb: Optional[float]) -> None:
+        """Several targets for the same disk (instances, [mount:PATH] sections) keep the strictest."""
+        self.min_space_gb = max(self.min_space_gb or 0.0, min_space_gb)
+        if download_minspace_gb is not None:
+            self.download_minspace_gb = max(self.download_minspace_gb or 0.0, download_minspace_gb)
+
+    def space_needed(self) -> Tuple[float, float]:
+        """
+        Return (GB below min_space_gb, GB below download_minspace_gb after the running downloads).
+        With a forecast the first value is at least what the forecast frees ahead of time.
+        """
+        space_needed = max(0, (self.min_space_gb or 0.0) - self.free_space, self.forecast_gb)
+        # Check if download_minspace_gb is set
+        if self.download_minspace_gb is not None:
+            space_left_after_downloads = self.free_space - self.remaining_download_gb
+            additional_space_needed = max(0, self.download_minspace_gb - space_left_after_downloads)
+        else:
+            additional_space_needed = 0
+        return space_needed, additional_space_needed
+
+
+class SpacePlanner:
+    """
+    Assigns every torrent to the filesystem of its translated save_path so each disk's
+    deficit is resolved only with torrents stored on that disk.
+
+    Disks are identified by st_dev. Paths are stat'ed once per planner and mount points are
+    looked up once per device. Torrents whose save path cannot be stat'ed (e.g. a missing
+    path mapping) are counted on their instance's drive_path disk, as before per-disk planning.
+    Only disks with a target are checked: the drive_path disk of each instance and every
+    [mount:PATH] section.
+    """
+
+    def __init__(self, logger: Logger):
+        self.logger = logger
+        self._devices: Dict[str, Optional[int]] = {}
+        self._mount_points: Dict[int, str] = {}
+
+    def device_of(self, path: str) -> Optional[int]:
+        if path not in self._devices:
+            instrumentation.count('stat_calls')
+            try:
+                self._devices[path] = os.stat(path).st_dev
+            except OSError:
+                self._devices[path] = None
+        return self._devices[path]
+
+    def mount_point(self, device: int, path: str) -> str:
+        if device not in self._mount_points:
+            self._mount_points[device] = torrent_utils.get_drive_path(path)
+        return self._mount_points[device]
+
+    def plan(self, instances: List[Instance], downloading: Dict[Instance, List[Dict[str, Any]]],
+             filtered_torrents: Dict[Instance, List[Dict[str, Any]]]) -> List[Disk]:
+        """
+        Return the disks with a free space target, with free space, downloads and candidates filled in.
+        downloading may hold any torrents; only those in the 'downloading' state are counted.
+        """
+        disks: Dict[int, Disk] = {}
+
+        def get_disk(device: int, path: str) -> Disk:
+            if device not in disks:
+                disks[device] = Disk(device, self.mount_point(device, path))
+            return disks[device]
+
+        for instance in instances:
+            rules = instance.rules
+            default_device = self.device_of(rules.drive_path)
+            if default_device is None:
+                raise FileNotFoundError(f"drive_path {rules.drive_path} does not exist")
+            default_disk = get_disk(default_device, rules.drive_path)
+            default_disk.add_target(rules.min_space_gb, rules.download_minspace_gb)
+            default_disk.instances.append(instance)
+            for target in rules.mount_targets:
+                device = self.device_of(target.path)
+                if device is None:
+                    instance.logger.warning(f"[mount:{target.path}] does not exist, ignoring it")
+                    continue
+                get_disk(device, target.path).add_target(target.min_space_gb, target.download_minspace_gb)
+
+            def disk_of(torrent: Dict[str, Any]) -> Disk:
+                save_path = rules.path_mapping.translate(torrent.get('save_path', ''))
+                device = self.device_of(save_path) if save_path else None
+                return default_disk if device is None else get_disk(device, save_path)
+
+            for torrent in downloading[instance]:
+                if torrent['state'] == 'downloading':
+                    disk = disk_of(torrent)
+                    disk.remaining_download_gb += torrent['size'] * (1 - torrent['progress']) / (1024**3)
+                    disk.downloads.append(torrent)
+            for torrent in filtered_torrents[instance]:
+                disk_of(torrent).candidates.setdefault(instance, []).append(torrent)
+
+        planned = [disk for disk in disks.values() if disk.min_space_gb is not None]
+        for disk in planned:
+            disk.free_space = torrent_utils.get_free_space(disk.mount_point)
+        return planned
@@ -4,8 +4,18 @@ import configparser
 import os
 import sys
 from datetime import datetime
-from typing import Dict, List, Any, Tuple, Set
+from typing import Dict, List, Any, Tuple, Set, Optional
 import logger_utils
+from torrent_state import TorrentStateMirror, get_state_mirror
+from torrent_record import TorrentRecord, STREAM_CHUNK_SIZE, iter_torrent_records
+from ratio_history import (RatioHistory, SqliteRatioStore, RingRatioStore, get_ratio_log_location, JSON_LOG_FILE,
+                           SQLITE_LOG_FILE)
+from rules import ApiSettings, Login, compile_instances
+from async_client import AsyncQbitClient
+from instances import instance_file_name
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+from metrics import MetricsExporter, ratio_log_metrics
 from contextlib import contextmanager
 
 # Constants
@@ -19,31 +29,57 @@ def load_configuration(script_directory: str) -> configparser.ConfigParser:
     config.read(config_path)
     return config
 
+def login(session: requests.Session, api_address: str, username: str, password: str) -> None:
+    """Log in to the qBittorrent API."""
+    login_url = f"{api_address}{API_V2_BASE}/auth/login"
+    response = session.post(login_url, data={'username': username, 'password': password})
+    if response.text != 'Ok.':
+        raise ConnectionError("Login failed")
+
 @contextmanager
-def api_session(api_address: str, username: str, password: str):
-    """Create and manage an API session."""
+def api_session(api_address: str, username: str, password: str, login_now: bool = True):
+    """Create and manage an API session. With login_now=False the caller logs in when needed."""
     session = requests.Session()
+    instrumentation.instrument_session(session)
     try:
-        login_url = f"{api_address}{API_V2_BASE}/auth/login"
-        response = session.post(login_url, data={'username': username, 'password': password})
-        if response.text != 'Ok.':
-            raise ConnectionError("Login failed")
+        if login_now:
+            login(session, api_address, username, password)
         yield session
     finally:
         session.close()
 
-def get_torrent_list(api_address: str, session: requests.Session) -> List[Dict[str, Any]]:
+def get_torrent_list(api_address: str, session: requests.Session, stream: bool = False) -> List[Dict[str, Any]]:
     """Fetch the list of torrents from the API."""
     torrent_list_url = f"{api_address}{API_V2_BASE}/torrents/info"
     try:
-        response = session.get(torrent_list_url)
+        response = session.get(torrent_list_url, stream=stream)
         response.raise_for_status()
-        return response.json()
+        instrumentation.count('json_loads')
+        if stream:
+            with response:
+                return list(iter_torrent_records(response.iter_content(STREAM_CHUNK_SIZE)))
+        return response.json(object_hook=TorrentRecord.from_json)
     except requests.RequestException as e:
         raise ConnectionError(f"Failed to fetch torrent list. Error: {e}")
     except json.JSONDecodeError:
         raise ValueError(f"Failed to decode JSON. Status Code: {response.status_code}")
 
+def sync_torrent_list(api_address: str, username: str, password: str, session: requests.Session,
+                      state_mirror: TorrentStateMirror, logger: Any) -> List[Dict[str, Any]]:
+    """Fetch the torrent list through the state mirror, logging in only if the persisted session expired."""
+    try:
+        try:
+            return state_mirror.sync(session, api_address, logger)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 403:
+                raise
+            login(session, api_address, username, password)
+            return state_mirror.sync(session, api_address, logger)
+    except requests.RequestException as e:
+        raise ConnectionError(f"Failed to sync torrent list. Error: {e}")
+    except json.JSONDecodeError:
+        raise ValueError("Failed to decode sync/maindata JSON")
+
 def load_existing_data(file_path: str) -> Dict[str, List[Dict[str, Any]]]:
     """Load existing data from the log file."""
     try:
@@ -96,30 +132,110 @@ def log_statistics(new_data: Dict[str, List[Dict[str, Any]]], old_hashes: Set[st
   
   torrents_with_max_entries = sum(1 for entries in new_data.values() if len(entries) >= max_entries)
 
+  log_snapshot_statistics(total_torrents, new_torrents_added, torrents_removed, torrents_with_max_entries, logger)
+
+def log_snapshot_statistics(total_torrents: int, new_torrents_added: int, torrents_removed: int, torrents_with_max_entries: int, logger: Any) -> None:
   logger.info(f"Total torrents in log: {total_torrents}, "
               f"New torrents added: {new_torrents_added}, "
               f"Torrents removed: {torrents_removed}, "
               f"Torrents with max entries: {torrents_with_max_entries}")
 
-def update_ratio_log(api_address: str, username: str, password: str, log_file_path: str, logger: Any, max_entries: int, purge_days: List[int]) -> None:
-  """Main function to update the ratio log."""
+def record_ratio_snapshot(torrents: List[Dict[str, Any]], log_file_path: str, logger: Any, max_entries: int, purge_days: List[int],
+                          backend: str = 'json') -> RatioHistory:
+  """Add today's ratios to the ratio log and return the updated history."""
+  if backend == 'sqlite':
+      store = SqliteRatioStore(log_file_path)
+      try:
+          statistics = store.record_snapshot(torrents, datetime.now().strftime('%Y-%m-%d'), max_entries, purge_days)
+          log_snapshot_statistics(*statistics, logger)
+          return store.load_history()
+      finally:
+          store.close()
+  if backend == 'ring':
+      store = RingRatioStore.load(log_file_path)
+      statistics = store.record_snapshot(torrents, datetime.now().strftime('%Y-%m-%d'), max_entries, purge_days)
+      store.save()
+      log_snapshot_statistics(*statistics, logger)
+      return store
+
+  old_data = load_existing_data(log_file_path)
+  
+  # Get the current set of torrent hashes before processing
+  old_hashes = set(old_data.keys())
+  
+  new_data, current_hashes = process_torrent_data(torrents, old_data, max_entries, purge_days)
+  save_data(log_file_path, new_data, logger)
+  
+  # Use old_hashes instead of old_data for comparison
+  log_statistics(new_data, old_hashes, current_hashes, logger, max_entries)
+  return RatioHistory.from_ratio_log(new_data)
+
+def fetch_torrents(login_details: Login, logger: Any, state_mirror: Optional[TorrentStateMirror] = None,
+                   api_settings: Optional[ApiSettings] = None) -> List[Dict[str, Any]]:
+  """Fetch the torrent list of one qBittorrent instance."""
+  api_address, username, password = login_details
+  if state_mirror is None and api_settings is not None and api_settings.client == 'asyncio':
+      # The client logs in on the first 403
+      client = AsyncQbitClient(login_details, api_settings, logger)
+      try:
+          return client.run(client.torrents_info())
+      finally:
+          client.close()
+          client.session.close()
+  with api_session(api_address, username, password, login_now=state_mirror is None) as session:
+      if state_mirror is not None:
+          return sync_torrent_list(api_address, username, password, session, state_mirror, logger)
+      return get_torrent_list(api_address, session, api_settings is not None and api_settings.stream_torrent_list)
+
+def update_ratio_log(instances: List[Tuple[Login, Optional[TorrentStateMirror]]], log_file_path: str, logger: Any, max_entries: int,
+                     purge_days: List[int], backend: str = 'json', api_settings: Optional[ApiSettings] = None,
+                     exporter: Optional[MetricsExporter] = None) -> None:
+  """
+  Main function to update the ratio log with the torrents of all (login, state mirror) instances,
+  fetched in parallel. If any instance fails nothing is recorded, because its torrents would
+  otherwise be dropped from the log. The run's metrics are published to exporter, also on failure.
+  """
+  stats = instrumentation.start_run()
+  history = None
+  torrents: List[Dict[str, Any]] = []
   try:
-      with api_session(api_address, username, password) as session:
-          torrents = get_torrent_list(api_address, session)
-          old_data = load_existing_data(log_file_path)
-          
-          # Get the current set of torrent hashes before processing
-          old_hashes = set(old_data.keys())
-          
-          new_data, current_hashes = process_torrent_data(torrents, old_data, max_entries, purge_days)
-          save_data(log_file_path, new_data, logger)
-          
-          # Use old_hashes instead of old_data for comparison
-          log_statistics(new_data, old_hashes, current_hashes, logger, max_entries)
+      with instrumentation.phase('fetch'):
+          with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+              torrent_lists = list(executor.map(lambda instance: fetch_torrents(instance[0], logger, instance[1], api_settings),
+                                                instances))
+      torrents = [torrent for torrent_list in torrent_lists for torrent in torrent_list]
+      with instrumentation.phase('ratio_log'):
+          history = record_ratio_snapshot(torrents, log_file_path, logger, max_entries, purge_days, backend)
 
   except Exception as e:
       logger.error(f"Failed to update ratio log: {e}")
       sys.exit(1)
+  finally:
+      if exporter is not None:
+          exporter.publish('ratio_log', ratio_log_metrics(stats, history, log_file_path, len(torrents)))
+
+def import_json_ratio_log(json_path: str, db_path: str, logger: Any) -> None:
+    """One-shot import of an existing torrent_ratio_log.json into the SQLite ratio log."""
+    store = SqliteRatioStore(db_path)
+    try:
+        rows = store.import_ratio_log(load_existing_data(json_path))
+        logger.info(f"Imported {rows} ratio records from {json_path} into {db_path}")
+    finally:
+        store.close()
+
+def import_json_ratio_ring(json_path: str, ring_path: str, max_entries: int, logger: Any) -> None:
+    """One-shot import of an existing torrent_ratio_log.json into the ring ratio log."""
+    store = RingRatioStore(ring_path)
+    ratios = store.import_ratio_log(load_existing_data(json_path), max_entries)
+    store.save()
+    logger.info(f"Imported {ratios} ratio records of {len(store)} torrents from {json_path} into {ring_path}")
+
+def get_logger_settings(config: configparser.ConfigParser) -> Tuple[int, List[int]]:
+    """Return (max_entries, purge_days) from the [torrent_ratio_logger] section."""
+    max_entries = config.getint('torrent_ratio_logger', 'max_entries', fallback=28)
+    purge_days_str = config.get('torrent_ratio_logger', 'purge_days', fallback='')
+    purge_days = [int(day.strip()) for day in purge_days_str.split(',') if day.strip()]
+    return max_entries, purge_days
 
 if __name__ == "__main__":
     script_directory = os.path.dirname(os.path.abspath(__file__))
@@ -127,16 +243,23 @@ if __name__ == "__main__":
 
     logger, log_handler = logger_utils.setup_logger()
 
-    api_address = config.get('login', 'address')
-    username = config.get('login', 'username')
-    password = config.get('login', 'password')
+    backend, log_file_path = get_ratio_log_location(config, script_directory)
 
-    log_file_path = os.path.join(script_directory, 'torrent_ratio_log.json')
+    max_entries, purge_days = get_logger_settings(config)
 
-    max_entries = config.getint('torrent_ratio_logger', 'max_entries', fallback=28)
-    purge_days_str = config.get('torrent_ratio_logger', 'purge_days', fallback='')
-    purge_days = [int(day.strip()) for day in purge_days_str.split(',') if day.strip()]
+    if '--import-json' in sys.argv:
+        json_path = os.path.join(script_directory, JSON_LOG_FILE)
+        if backend == 'ring':
+            import_json_ratio_ring(json_path, log_file_path, max_entries, logger)
+        else:
+            import_json_ratio_log(json_path, os.path.join(script_directory, SQLITE_LOG_FILE), logger)
+        log_handler.write_log_entries()
+        sys.exit(0)
 
     logger.info("Running torrent ratio logger script")
-    update_ratio_log(api_address, username, password, log_file_path, logger, max_entries, purge_days)
+    instances = compile_instances(config, script_directory)
+    update_ratio_log([(rules.login, get_state_mirror(config, script_directory, instance_file_name('torrent_state.json', name)))
+                      for name, rules in instances],
+                     log_file_path, logger, max_entries, purge_days, backend, instances[0][1].api,
+                     MetricsExporter(config, logger))
     log_handler.write_log_entries()
\ No newline at end of file
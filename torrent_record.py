@@ -0,0 +1,109 @@
+import codecs
+import json
+from typing import Dict, Any, Iterable, Iterator, Optional
+
+# The /torrents/info fields the cleanup and the ratio logger read; everything else is dropped while parsing
+TORRENT_FIELDS = ('hash', 'name', 'category', 'size', 'progress', 'state', 'ratio', 'seeding_time',
+                  'save_path', 'content_path', 'dlspeed', 'eta')
+_KEYS = frozenset(TORRENT_FIELDS + ('average_ratio',))
+STREAM_CHUNK_SIZE = 64 * 1024
+_WHITESPACE = ' \t\n\r'
+
+
+class TorrentRecord:
+    """
+    Compact stand-in for a /torrents/info JSON object with dict-style access.
+
+    Only TORRENT_FIELDS are kept, in slots, so a record takes a fraction of the memory of the
+    ~50-key dict. Pass from_json as the object_hook when decoding the torrent list so the full
+    dicts are discarded one at a time instead of all living until the list is converted.
+    'average_ratio' is the score set by the pipeline. Missing fields raise KeyError like a dict.
+    """
+
+    __slots__ = TORRENT_FIELDS + ('average_ratio',)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> 'TorrentRecord':
+        record = cls.__new__(cls)
+        for field in TORRENT_FIELDS:
+            if field in data:
+                setattr(record, field, data[field])
+        return record
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _KEYS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in _KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: object) -> bool:
+        return key in _KEYS and hasattr(self, key)
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        return getattr(self, key, default) if key in _KEYS else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.__slots__ if hasattr(self, key)}
+
+    def __repr__(self) -> str:
+        return f"TorrentRecord({self.to_dict()!r})"
+
+
+def iter_torrent_records(chunks: Iterable[bytes]) -> Iterator[TorrentRecord]:
+    """
+    Decode a JSON array of torrents from byte chunks (e.g. response.iter_content()), yielding
+    one TorrentRecord per element as soon as it is complete. Only the unparsed tail of the body
+    is buffered, so memory does not grow with the size of the response.
+    Raises ValueError if the body is not a JSON array of objects.
+    """
+    decoder = json.JSONDecoder(object_hook=TorrentRecord.from_json)
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    separators = _WHITESPACE
+    started = False
+    finished = False
+    while True:
+        # Skip separators and find the start of the next element
+        while position < len(buffer) and buffer[position] in separators:
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("Torrent list is not a JSON array")
+                started = True
+                separators = _WHITESPACE + ','
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if finished:
+                    raise
+            else:
+                if not isinstance(record, TorrentRecord):
+                    raise ValueError("Torrent list contains a non-object element")
+                position = end
+                yield record
+                continue
+        elif finished:
+            raise ValueError("Torrent list ended before the closing ']'")
+        # The next element is incomplete: drop what was parsed and read another chunk
+        buffer = buffer[position:]
+        position = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer += utf8.decode(b'', final=True)
+            finished = True
+        else:
+            buffer += utf8.decode(chunk)
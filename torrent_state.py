@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+from typing import Dict, List, Any, Optional
+from logging import Logger
+import configparser
+import requests
+import torrent_utils
+import instrumentation
+from torrent_record import TORRENT_FIELDS, TorrentRecord
+
+# Constants
+API_V2_BASE = "/api/v2"
+SESSION_COOKIE = torrent_utils.SESSION_COOKIE
+
+
+class TorrentStateMirror:
+    """
+    Local mirror of qBittorrent's torrent list, kept up to date from /sync/maindata.
+
+    The response id (rid) and the WebUI session cookie are persisted between runs: qBittorrent
+    computes deltas per WebUI session, so a run that reuses both only receives the torrents that
+    changed since the previous run. When the session expired or the rid is unknown to the server,
+    qBittorrent answers with a full update and the mirror is rebuilt from it.
+    Only the TORRENT_FIELDS of each torrent are kept.
+    """
+
+    def __init__(self, state_file_path: str):
+        self.state_file_path = state_file_path
+        self.rid = 0
+        self.sid: Optional[str] = None
+        self.torrents: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.state_file_path, 'r') as file:
+                state = json.load(file)
+            self.rid = state['rid']
+            self.sid = state.get('sid')
+            self.torrents = state['torrents']
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Error reading torrent state from {self.state_file_path}, starting over: {str(e)}")
+            self.rid, self.sid, self.torrents = 0, None, {}
+
+    def save(self, logger: Logger) -> None:
+        """
+        Atomically write the mirror to the state file. main.py and torrent_ratio_logger.py share
+        it, so every writer goes through its own temporary file and the last complete one wins.
+        """
+        directory, name = os.path.split(os.path.abspath(self.state_file_path))
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+        except OSError as e:
+            logger.error(f"Error saving torrent state file: {e}")
+            return
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump({'rid': self.rid, 'sid': self.sid, 'torrents': self.torrents}, file)
+            os.replace(temp_path, self.state_file_path)
+        except OSError as e:
+            logger.error(f"Error saving torrent state file: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def restore_session(self, session: requests.Session) -> None:
+        """Reuse the persisted WebUI session so the server can answer with deltas."""
+        if self.sid and not any(cookie.name == SESSION_COOKIE for cookie in session.cookies):
+            session.cookies.set(SESSION_COOKIE, self.sid)
+
+    def apply(self, maindata: Dict[str, Any]) -> None:
+        """Apply a full or partial /sync/maindata response to the mirror."""
+        if maindata.get('full_update'):
+            self.torrents = {}
+        for torrent_hash, fields in maindata.get('torrents', {}).items():
+            torrent = self.torrents.setdefault(torrent_hash, {'hash': torrent_hash})
+            torrent.update((field, value) for field, value in fields.items() if field in TORRENT_FIELDS)
+        for torrent_hash in maindata.get('torrents_removed', []):
+            self.torrents.pop(torrent_hash, None)
+        self.rid = maindata.get('rid', 0)
+
+    def sync(self, session: requests.Session, api_address: str, logger: Logger) -> List[Dict[str, Any]]:
+        """
+        Fetch the changes since the last sync, persist the mirror and return the torrent list.
+        Raises requests.HTTPError like get_torrent_list, so callers can log in again on 403.
+        """
+        self.restore_session(session)
+        maindata_url = f"{api_address}{API_V2_BASE}/sync/maindata"
+        response = session.get(maindata_url, params={'rid': self.rid})
+        if response.status_code == 403:
+            # Drop the expired session so the caller's fresh login is the only SID sent
+            torrent_utils.clear_session_cookie(session)
+            self.sid = None
+        response.raise_for_status()
+
+        instrumentation.count('json_loads')
+        maindata = response.json()
+        self.apply(maindata)
+        self.sid = next((cookie.value for cookie in session.cookies if cookie.name == SESSION_COOKIE), None)
+        self.save(logger)
+        logger.debug(f"Synced torrent state (rid={self.rid}, full_update={bool(maindata.get('full_update'))}, "
+                     f"changed={len(maindata.get('torrents', {}))}, removed={len(maindata.get('torrents_removed', []))})")
+        return [TorrentRecord.from_json(torrent) for torrent in self.torrents.values()]
+
+
+def get_state_mirror(config: configparser.ConfigParser, script_directory: str,
+                     file_name: str = 'torrent_state.json') -> Optional[TorrentStateMirror]:
+    """Return the torrent state mirror if use_sync_maindata is enabled, otherwise None."""
+    if not config.getboolean('torrent_state', 'use_sync_maindata', fallback=False):
+        return None
+    return TorrentStateMirror(os.path.join(script_directory, file_name))